@@ -0,0 +1,98 @@
+"""
+Finds the @font-face and @keyframes blocks of stylesheets that nothing
+uses: font faces whose family no font-family or font declaration names,
+and keyframes that no animation-name or animation declaration names.
+Only the declarations of rules with a selector that matched an element
+of the pages count, so a font face is reported if no page can load it.
+Style attributes in the pages are not looked at.
+"""
+from nodes import FontFace, Keyframes, Media, Supports, unquote
+from report import line_starts, locate
+import re
+
+vendor = re.compile(r'-[a-z]+-')
+
+def families(values, shorthand=False):
+    """
+    Returns the lower-cased font family names in the values of a
+    font-family declaration.  In those of a font declaration, if
+    shorthand is True, the family is at the end of the first value, after
+    the style and size, so each run of its last words is taken.
+    """
+    groups = [[]]
+    for value in values:
+        if value == ',':
+            groups.append([])
+        else:
+            groups[-1].append(unquote(value))
+    names = set(' '.join(words).lower() for words in groups if words)
+    if shorthand:
+        words = groups[0]
+        names.update(' '.join(words[i:]).lower()
+                     for i in range(len(words)))
+    return names
+
+class AtRuleUsage:
+    """
+    The font faces and keyframes of a list of stylesheets, given as (path,
+    text, Stylesheet node) tuples, and the font families and animations
+    named by the rules with a selector in used, the set of selectors that
+    matched.  faces and keyframes hold (name, path, node) tuples.
+    """
+
+    def __init__(self, stylesheets, used):
+        self.faces = []
+        self.keyframes = []
+        self.families = set()
+        self.animations = set()
+        for css_path, data, stylesheet in stylesheets:
+            self.collect(css_path, stylesheet.statements, used)
+
+    def collect(self, path, statements, used):
+        for statement in statements:
+            if isinstance(statement, (Media, Supports)):
+                self.collect(path, statement.rules, used)
+            elif isinstance(statement, FontFace):
+                for declaration in statement.declarations:
+                    if declaration.property.lower() == 'font-family':
+                        name = ' '.join(unquote(value) for value
+                                        in declaration.values)
+                        self.faces.append((name, path, statement))
+            elif isinstance(statement, Keyframes):
+                self.keyframes.append((statement.name, path, statement))
+            elif getattr(statement, 'selectors', None) is not None and \
+                 [s for s in statement.selectors.selectors
+                  if s.text in used]:
+                self.add(statement.declarations)
+
+    def add(self, declarations):
+        """Adds the families and animations named by declarations."""
+        for declaration in declarations:
+            name = vendor.sub('', declaration.property.lower(), 1)
+            if name == 'font-family':
+                self.families.update(families(declaration.values))
+            elif name == 'font':
+                self.families.update(families(declaration.values, True))
+            elif name in ('animation', 'animation-name'):
+                self.animations.update(unquote(value) for value
+                                       in declaration.values)
+
+    def unused_faces(self):
+        return [face for face in self.faces
+                if face[0].lower() not in self.families]
+
+    def unused_keyframes(self):
+        return [keyframes for keyframes in self.keyframes
+                if keyframes[0] not in self.animations]
+
+    def report(self, out):
+        """Writes the unused font faces and keyframes to out."""
+        starts = {}
+        for title, unused in (('Unused @font-face:', self.unused_faces()),
+                              ('Unused @keyframes:', self.unused_keyframes())):
+            print >> out, title
+            for name, path, node in unused:
+                if path not in starts:
+                    starts[path] = line_starts(path)
+                line, column = locate(starts[path], node.start)
+                print >> out, '  {0}  ({1}:{2})'.format(name, path, line)
@@ -0,0 +1,423 @@
+"""
+Measures the throughput of the lexer, the parser and selector matching on
+generated stylesheets and pages, so changes to any of them can be compared
+run against run.
+
+    python benchmark.py --sizes 10K,1M --output before.json
+    python benchmark.py --sizes 10K,1M --compare before.json
+
+With --verify-tokenizer, it instead checks that tokenizer.Tokenizer gives
+the same tokens as the ply lexer for the examples and generated input.
+"""
+from lexer import CSSLexer
+from tokenizer import Tokenizer
+from parser import CSSParser
+from document import Document
+from matcher import Matcher
+import css3tool
+import cssselect
+import lxml.etree
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+
+tags = ['div', 'span', 'p', 'a', 'ul', 'li', 'section', 'article',
+        'header', 'footer', 'nav', 'h1', 'h2', 'img', 'button', 'input']
+pseudos = [':hover', ':first-child', ':last-child', ':focus', ':visited']
+combinators = [' ', ' > ', ' + ', ' ~ ']
+declarations = ['color: #336699', 'margin: 0 auto', 'padding: 4px 8px',
+                'font: 12px "Helvetica Neue", sans-serif',
+                'background: url(img/bg.png) no-repeat', 'width: 50%',
+                'display: block', 'border: 1px solid rgb(0, 0, 0)',
+                'z-index: 10', 'line-height: 1.2em']
+media = ['screen', 'print', 'screen and (max-width: 600px)',
+         'only screen and (min-width: 1024px)']
+
+# Pieces of CSS, broken or not, that are thrown together to check the
+# tokenizer against the ply lexer on odd input.
+fragments = ['url(', ')', '(', '"', "'", '\\', '\\31 ', '\\(', '/*', '*/',
+             '<!--', '-->', '-', '+', '.', '1', '1.5', '-2', 'em', '%', '#',
+             '@import', '@media', '@font-face', '@page', '@charset', 'not(',
+             'not', 'nothing', 'Only', 'AND', 'android', 'url(a.png)',
+             "url('x')", 'url( x )', '\n', ' ', '\t', '\r\n', '\f', '~=',
+             '|=', '^=', '$=', '*=', '^', '$', '!', '&', '?', '\xc3\xa9', 'a',
+             'b_c', '-moz-', 'calc(', '{', '}', ';', ':', ',', '[', ']',
+             '=', '>', '~', '|', '*', '"a b"', "'c\\'d'", 'e9']
+
+# Stylesheets use twice as many class names and ids as pages do, so about
+# half of the simple selectors are unused.
+css_names = 200
+html_names = 100
+
+def parse_size(text):
+    """Parses a size such as 512, 10K or 50M into a number of bytes."""
+    units = {'K': 1024, 'M': 1024 * 1024}
+    text = text.strip().upper()
+    if text[-1:] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+class Generator:
+    """
+    Generates stylesheets and pages from a seeded random number generator,
+    so the same arguments always give the same input.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    def name(self, prefix, count):
+        return '{0}{1}'.format(prefix, self.random.randrange(count))
+
+    def compound(self, complexity):
+        r = self.random
+        if complexity == 'simple':
+            return r.choice([r.choice(tags),
+                             '.' + self.name('c', css_names),
+                             '#' + self.name('i', css_names)])
+
+        parts = []
+        if r.random() < 0.5:
+            parts.append(r.choice(tags))
+        for i in range(r.randint(1, 2)):
+            parts.append('.' + self.name('c', css_names))
+        if r.random() < 0.1:
+            parts.append('#' + self.name('i', css_names))
+        if r.random() < 0.2:
+            op = r.choice(['=', '^=', '*=', '~='])
+            parts.append('[data-{0}{1}"{2}"]'.format(
+                         self.name('a', 10), op, self.name('v', 10)))
+        if r.random() < 0.2:
+            parts.append(r.choice(pseudos))
+        if complexity == 'complex' and r.random() < 0.2:
+            parts.append(':not(.{0})'.format(self.name('c', css_names)))
+        return ''.join(parts)
+
+    def selector(self, complexity):
+        r = self.random
+        length = {'simple': 1, 'compound': r.randint(1, 2),
+                  'complex': r.randint(2, 5)}[complexity]
+        selector = self.compound(complexity)
+        for i in range(length - 1):
+            selector += r.choice(combinators) + self.compound(complexity)
+        return selector
+
+    def rule(self, complexity):
+        r = self.random
+        selectors = [self.selector(complexity)
+                     for i in range(r.randint(1, 3))]
+        body = '; '.join(r.sample(declarations, r.randint(1, 4)))
+        return '{0} {{ {1} }}\n'.format(', '.join(selectors), body)
+
+    def stylesheet(self, size, complexity='compound', media_every=20):
+        """
+        Returns (css, rules): a stylesheet of at least size bytes and the
+        number of rules in it.  Every media_every-th rule is wrapped in an
+        @media block.
+        """
+        chunks = []
+        length = 0
+        rules = 0
+        while length < size:
+            rule = self.rule(complexity)
+            if media_every and rules % media_every == media_every - 1:
+                rule = '@media {0} {{\n  {1}}}\n'.format(
+                       self.random.choice(media), rule)
+            chunks.append(rule)
+            length += len(rule)
+            rules += 1
+        return ''.join(chunks), rules
+
+    def noise(self, size):
+        """Returns about size characters of fragments in any order."""
+        chunks = []
+        length = 0
+        while length < size:
+            chunk = self.random.choice(fragments)
+            chunks.append(chunk)
+            length += len(chunk)
+        return ''.join(chunks)
+
+    def page(self, elements, depth=12):
+        """Returns an HTML page of about the given number of elements."""
+        r = self.random
+        out = ['<html><head><title>benchmark</title></head><body>']
+        open_tags = []
+        for i in range(elements):
+            while open_tags and (len(open_tags) >= depth or
+                                 r.random() < 0.3):
+                out.append('</{0}>'.format(open_tags.pop()))
+            tag = r.choice(tags)
+            attrs = ''
+            if r.random() < 0.7:
+                attrs += ' class="{0}"'.format(' '.join(
+                         self.name('c', html_names)
+                         for j in range(r.randint(1, 3))))
+            if r.random() < 0.05:
+                attrs += ' id="{0}"'.format(self.name('i', html_names))
+            if r.random() < 0.1:
+                attrs += ' data-{0}="{1}"'.format(self.name('a', 10),
+                                                  self.name('v', 10))
+            out.append('<{0}{1}>'.format(tag, attrs))
+            if tag not in ('img', 'input'):
+                open_tags.append(tag)
+        while open_tags:
+            out.append('</{0}>'.format(open_tags.pop()))
+        out.append('</body></html>')
+        return ''.join(out)
+
+def best_of(repeat, function):
+    """
+    Calls function repeat times and returns the shortest time taken and
+    the value of the last call.
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        value = function()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, value
+
+def bench_lexer(lexer, css, repeat):
+    def run():
+        lexer.lexer.input(css)
+        count = 0
+        while lexer.token():
+            count += 1
+        return count
+    seconds, count = best_of(repeat, run)
+    return {'tokens': count, 'seconds': seconds,
+            'tokens_per_sec': count / seconds}
+
+class Records(logging.Handler):
+    """A logging handler that keeps the message of each record instead."""
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+def tokens(lexer, data):
+    """
+    Returns the (type, value, lexpos, lineno) of each token of data, along
+    with the messages the lexer logged while reading it, such as those of
+    illegal characters.  The messages are kept out of the log.
+    """
+    logger = logging.getLogger()
+    handlers = logger.handlers
+    records = Records()
+    logger.handlers = [records]
+    try:
+        lexer.lexer.input(data)
+        found = []
+        while True:
+            tok = lexer.token()
+            if not tok:
+                break
+            found.append((tok.type, tok.value, tok.lexpos, tok.lineno))
+        return found, records.messages
+    finally:
+        logger.handlers = handlers
+
+def verify_tokenizer(inputs):
+    """
+    Checks that a Tokenizer gives the same tokens as the ply lexer for
+    each (name, data) pair of inputs.  Returns the names of the inputs
+    they differ on, logging where.
+    """
+    ply_lexer = CSSLexer()
+    fast_lexer = CSSLexer()
+    fast_lexer.lexer = Tokenizer()
+
+    differ = []
+    for name, data in inputs:
+        expected, expected_output = tokens(ply_lexer, data)
+        found, output = tokens(fast_lexer, data)
+        if found == expected and output == expected_output:
+            continue
+        differ.append(name)
+        for i, (a, b) in enumerate(map(None, expected, found)):
+            if a != b:
+                logging.error('{0}: token {1} is {2}, expected {3}'.format(
+                              name, i, b, a))
+                break
+        else:
+            logging.error('{0}: logged {1!r}, expected {2!r}'.format(
+                          name, output, expected_output))
+    return differ
+
+def bench_parser(parser, css, rules, repeat):
+    seconds, stylesheet = best_of(repeat, lambda: parser.parse(css))
+    return {'rules': rules, 'selectors': len(parser.selectors),
+            'seconds': seconds, 'rules_per_sec': rules / seconds}
+
+def bench_matching(parser, css, document, repeat):
+    elements = sum(1 for el in document.root.iter())
+
+    def run():
+        # Start each run with no compiled selectors.
+        css3tool.matcher = Matcher()
+        return css3tool.get_unused_selectors(css, document, parser)
+    seconds, unused = best_of(repeat, run)
+    pairs = len(parser.selectors) * elements
+    return {'selectors': len(parser.selectors), 'elements': elements,
+            'unused': len(unused), 'seconds': seconds,
+            'pairs_per_sec': pairs / seconds}
+
+def compare(results, baseline):
+    """Prints the change in each rate from the results in baseline."""
+    rates = ('tokens_per_sec', 'rules_per_sec', 'pairs_per_sec')
+    before = {}
+    for result in baseline['results']:
+        before[result['name']] = result
+    for result in results['results']:
+        old = before.get(result['name'])
+        if old is None:
+            continue
+        for rate in rates:
+            if rate in result and rate in old:
+                print '{0:40} {1:>14.0f} {2:>14.0f} {3:>+7.1f}%'.format(
+                      result['name'], old[rate], result[rate],
+                      (result[rate] / old[rate] - 1) * 100)
+
+if __name__ == '__main__':
+
+    argparser = argparse.ArgumentParser(
+                    description='Benchmarks the lexer, parser and matcher on '
+                                'generated input.')
+    argparser.add_argument('--sizes',
+                           dest='sizes',
+                           default='10K,100K,1M',
+                           help='comma separated stylesheet sizes to lex and '
+                                'parse, up to 50M (default: 10K,100K,1M)')
+    argparser.add_argument('--complexity',
+                           dest='complexity',
+                           default='simple,compound,complex',
+                           help='comma separated selector complexities: '
+                                'simple, compound and/or complex')
+    argparser.add_argument('--elements',
+                           dest='elements',
+                           default='1000,10000',
+                           help='comma separated page sizes, in elements, '
+                                'to match against (default: 1000,10000)')
+    argparser.add_argument('--match-size',
+                           dest='match_size',
+                           default='10K',
+                           help='size of the stylesheet matched against '
+                                'each page (default: 10K)')
+    argparser.add_argument('--repeat',
+                           dest='repeat',
+                           type=int,
+                           default=3,
+                           help='times each measurement is repeated, the '
+                                'best being kept (default: 3)')
+    argparser.add_argument('--seed',
+                           dest='seed',
+                           type=int,
+                           default=0,
+                           help='seed for the generated input (default: 0)')
+    argparser.add_argument('--output',
+                           dest='output',
+                           metavar='<file>',
+                           help='file to write the JSON results to instead '
+                                'of standard output')
+    argparser.add_argument('--verify-tokenizer',
+                           dest='verify',
+                           action='store_true',
+                           help='check that the hand-written tokenizer gives '
+                                'the same tokens as the ply lexer, instead of '
+                                'benchmarking')
+    argparser.add_argument('--compare',
+                           dest='compare',
+                           metavar='<file>',
+                           help='JSON results of an earlier run to compare '
+                                'these results with')
+    args = argparser.parse_args()
+
+    sizes = [parse_size(s) for s in args.sizes.split(',')]
+    complexities = args.complexity.split(',')
+    for complexity in complexities:
+        if complexity not in ('simple', 'compound', 'complex'):
+            argparser.error('unknown complexity {0}'.format(complexity))
+
+    if args.verify:
+        inputs = []
+        example = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'example')
+        for root, dirs, files in os.walk(example):
+            for name in sorted(files):
+                if name.endswith('.css'):
+                    path = os.path.join(root, name)
+                    inputs.append((path, open(path).read()))
+        for complexity in complexities:
+            for size in sizes:
+                css, rules = Generator(args.seed).stylesheet(size, complexity)
+                inputs.append(('{0} {1}'.format(complexity, size), css))
+        for seed in range(args.seed, args.seed + 100):
+            inputs.append(('noise {0}'.format(seed),
+                           Generator(seed).noise(2000)))
+
+        differ = verify_tokenizer(inputs)
+        sys.stderr.write('{0} of {1} inputs tokenized differently\n'.format(
+                         len(differ), len(inputs)))
+        sys.exit(differ and 1 or 0)
+
+    lexer = CSSLexer()
+    fast_lexer = CSSLexer()
+    fast_lexer.lexer = Tokenizer()
+    parser = CSSParser()
+    fast_parser = CSSParser(fast=True)
+
+    results = {'python': platform.python_version(),
+               'lxml': lxml.etree.__version__,
+               'cssselect': cssselect.__version__,
+               'seed': args.seed,
+               'results': []}
+
+    def report(name, result):
+        result['name'] = name
+        results['results'].append(result)
+        sys.stderr.write('{0}: {1:.3f}s\n'.format(name, result['seconds']))
+
+    for complexity in complexities:
+        for size in sizes:
+            css, rules = Generator(args.seed).stylesheet(size, complexity)
+            report('lexer {0} {1}'.format(complexity, size),
+                   bench_lexer(lexer, css, args.repeat))
+            report('tokenizer {0} {1}'.format(complexity, size),
+                   bench_lexer(fast_lexer, css, args.repeat))
+            report('parser {0} {1}'.format(complexity, size),
+                   bench_parser(parser, css, rules, args.repeat))
+            report('fast parser {0} {1}'.format(complexity, size),
+                   bench_parser(fast_parser, css, rules, args.repeat))
+
+    match_size = parse_size(args.match_size)
+    for complexity in complexities:
+        css, rules = Generator(args.seed).stylesheet(match_size, complexity)
+        for elements in args.elements.split(','):
+            document = Document(Generator(args.seed).page(int(elements)))
+            report('match {0} {1} {2}'.format(complexity, match_size,
+                                              elements),
+                   bench_matching(parser, css, document, args.repeat))
+
+    if args.output:
+        fh = open(args.output, 'w')
+        json.dump(results, fh, indent=2)
+        fh.close()
+    else:
+        print json.dumps(results, indent=2)
+
+    if args.compare:
+        fh = open(args.compare)
+        baseline = json.load(fh)
+        fh.close()
+        compare(results, baseline)
@@ -0,0 +1,129 @@
+import cPickle as pickle
+import hashlib
+import logging
+import os
+
+class ResultCache:
+    """
+    A directory of results kept between runs, keyed by the hash of the
+    content they were worked out from.
+
+    For each CSS file it keeps the selectors parsed from it and the
+    offsets of their rules, and for each HTML page whether each selector
+    checked against it matched, so a run only parses the stylesheets and
+    checks the pages that have changed.
+
+    salt is mixed into every key; it should change whenever the parser or
+    the matching would give different results for the same content.  Once
+    the cache grows past max_size bytes, evict() removes the least
+    recently used entries.
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024, salt=''):
+        self.directory = directory
+        self.max_size = max_size
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        for name in ('stylesheets', 'matches'):
+            path = os.path.join(directory, name)
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+    def digest(self, data):
+        return hashlib.sha1(self.salt + data).hexdigest()
+
+    def file_digest(self, path, chunk_size=65536):
+        digest = hashlib.sha1(self.salt)
+        fh = open(path, 'rb')
+        try:
+            while True:
+                chunk = fh.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        finally:
+            fh.close()
+        return digest.hexdigest()
+
+    def get_stylesheet(self, key):
+        """
+        Returns the selectors cached for a CSS file and the offsets of their
+        rules, as a pair, or None.
+        """
+        return self.load('stylesheets', key)
+
+    def put_stylesheet(self, key, selectors, offsets):
+        self.store('stylesheets', key, (selectors, offsets))
+
+    def get_matches(self, key):
+        """
+        Returns a dict mapping each selector checked against an HTML page
+        to whether it matched.
+        """
+        return self.load('matches', key) or {}
+
+    def put_matches(self, key, matches):
+        self.store('matches', key, matches)
+
+    def load(self, kind, key):
+        path = os.path.join(self.directory, kind, key)
+        try:
+            fh = open(path, 'rb')
+        except IOError:
+            self.misses += 1
+            return None
+        try:
+            value = pickle.load(fh)
+        except Exception as e:
+            logging.debug('Ignoring unreadable cache entry {0}: {1}'.format(
+                          path, e))
+            self.misses += 1
+            return None
+        finally:
+            fh.close()
+
+        # Reading an entry marks it as recently used, for evict().
+        os.utime(path, None)
+        self.hits += 1
+        return value
+
+    def store(self, kind, key, value):
+        path = os.path.join(self.directory, kind, key)
+        tmp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        fh = open(tmp_path, 'wb')
+        pickle.dump(value, fh, pickle.HIGHEST_PROTOCOL)
+        fh.close()
+        os.rename(tmp_path, path)
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is no
+        larger than max_size.
+        """
+        entries = []
+        total = 0
+        for kind in ('stylesheets', 'matches'):
+            directory = os.path.join(self.directory, kind)
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def stats(self):
+        return 'result cache: {0} hits, {1} misses'.format(self.hits,
+                                                           self.misses)
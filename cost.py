@@ -0,0 +1,172 @@
+"""
+Estimates what selectors cost a browser to match, for finding the ones
+that slow down rendering rather than the ones that are unused.
+
+Browsers match selectors right to left.  Each element in the bucket of
+the rightmost compound selector, those with its id, else with one of its
+classes, else with its tag, else every element, is tested against it.
+Each descendant or general sibling combinator then walks the element's
+ancestors or previous siblings, testing the next compound on each.  The
+cost of a selector is estimated per element tested from the number of
+simple selectors it tests, each weighted by how much work it takes, and
+the average depth and number of previous siblings of the page's elements.
+Its score is that cost times the number of elements tested, summed over
+the pages.
+"""
+from nodes import Media, Supports
+from report import line_starts, locate
+
+# What testing each kind of simple selector costs, relative to testing a
+# tag, id or class.  Attribute operators other than '=' have to split or
+# scan the value, and structural pseudo-classes have to count siblings.
+attribute_costs = {None: 1, '=': 1, '~=': 2, '|=': 2, '^=': 2, '$=': 2,
+                   '*=': 4}
+pseudo_costs = {'nth-child': 3, 'nth-last-child': 3, 'nth-of-type': 3,
+                'nth-last-of-type': 3, 'first-of-type': 2,
+                'last-of-type': 2, 'only-of-type': 3, 'empty': 2}
+negation_cost = 2
+
+def compound_cost(compound):
+    """Returns the cost of testing an element against a Compound."""
+    cost = len(compound.ids) + len(compound.classes)
+    if compound.element not in (None, '*'):
+        cost += 1
+    for attribute in compound.attributes:
+        cost += attribute_costs.get(attribute.op, 1)
+    for pseudo in compound.pseudos:
+        cost += pseudo_costs.get(pseudo.name.lower(), 1)
+    for negation in compound.negations:
+        cost += negation_cost + compound_cost(negation.argument)
+    return max(cost, 1)
+
+def selector_cost(selector, depth, siblings):
+    """
+    Returns the cost of testing an element against a Selector node, on a
+    page whose elements have depth ancestors and siblings previous
+    siblings on average.  The compounds left of a descendant or general
+    sibling combinator are tested that many times as often.
+    """
+    walks = {' ': max(depth, 1), '~': max(siblings, 1), '>': 1, '+': 1}
+    compounds = selector.compounds
+    cost = compound_cost(compounds[-1])
+    tries = 1
+    for i in range(len(compounds) - 2, -1, -1):
+        tries *= walks[selector.combinators[i].value]
+        cost += tries * compound_cost(compounds[i])
+    return cost
+
+def tested(compound, index):
+    """
+    Returns the number of elements of a page, given its ElementIndex, in
+    the bucket a browser tests a rightmost Compound against.
+    """
+    if compound.ids:
+        return min(index.ids.get(id, 0) for id in compound.ids)
+    if compound.classes:
+        return min(index.classes.get(cls, 0) for cls in compound.classes)
+    if compound.element not in (None, '*') and compound.namespace is None:
+        return index.tags.get(compound.element.lower(), 0)
+    return index.elements
+
+def reasons(selector):
+    """Returns what makes a Selector node costly, as a list of phrases."""
+    found = []
+    rightmost = selector.compounds[-1]
+    if not rightmost.ids and not rightmost.classes:
+        if rightmost.element in (None, '*'):
+            found.append('universal rightmost compound')
+        else:
+            found.append('tag rightmost compound')
+    walks = len([c for c in selector.combinators if c.value in ' ~'])
+    if walks > 1:
+        found.append('{0} descendant or sibling combinators'.format(walks))
+    substrings = 0
+    negations = 0
+    for compound in selector.compounds:
+        substrings += len([a for a in compound.attributes if a.op == '*='])
+        negations += len(compound.negations)
+    if substrings:
+        found.append('{0} substring attribute match(es)'.format(substrings))
+    if negations:
+        found.append('{0} :not()'.format(negations))
+    return found
+
+def page_shape(root):
+    """
+    Returns the average number of ancestors and of previous siblings of
+    the elements under root.
+    """
+    elements = 0
+    depths = 0
+    siblings = 0
+    stack = [(root, 0)]
+    while stack:
+        el, depth = stack.pop()
+        children = [child for child in el
+                    if isinstance(child.tag, basestring)]
+        elements += 1
+        depths += depth
+        # The ith child has i previous siblings.
+        siblings += len(children) * (len(children) - 1) / 2
+        stack.extend((child, depth + 1) for child in children)
+    return float(depths) / elements, float(siblings) / elements
+
+def collect_selectors(statements, found):
+    """Adds each Selector node among statements, and its Rule, to found."""
+    for statement in statements:
+        if isinstance(statement, (Media, Supports)):
+            collect_selectors(statement.rules, found)
+        elif getattr(statement, 'selectors', None) is not None:
+            for selector in statement.selectors.selectors:
+                found.append((selector, statement))
+
+class CostReport:
+    """
+    The score of each selector of a list of stylesheets, given as (path,
+    text, Stylesheet node) tuples, added up over the pages passed to add.
+    Each entry of scores is a [score, selector text, path, offset of its
+    rule, cost per element on the last page, elements tested, reasons]
+    list.  pages holds the paths of the pages added.
+    """
+
+    def __init__(self, stylesheets):
+        self.selectors = []
+        self.pages = set()
+        for css_path, data, stylesheet in stylesheets:
+            found = []
+            collect_selectors(stylesheet.statements, found)
+            for selector, rule in found:
+                self.selectors.append((selector, css_path, rule.start))
+        self.scores = [[0, selector.text, path, offset, 0, 0,
+                        reasons(selector)]
+                       for selector, path, offset in self.selectors]
+
+    def add(self, document):
+        """Adds the cost of matching every selector on a Document."""
+        self.pages.add(document.path)
+        index = document.index
+        depth, siblings = page_shape(document.root)
+        for (selector, path, offset), score in zip(self.selectors,
+                                                   self.scores):
+            cost = selector_cost(selector, depth, siblings)
+            count = tested(selector.compounds[-1], index)
+            score[0] += cost * count
+            score[4] = cost
+            score[5] += count
+
+    def worst(self, limit):
+        """Returns the limit highest scores, highest first."""
+        return sorted(self.scores, key=lambda score: -score[0])[:limit]
+
+    def report(self, out, limit):
+        """Writes the limit costliest selectors to out."""
+        starts = {}
+        print >> out, 'Expensive Selectors:'
+        for score, text, path, offset, cost, count, why in self.worst(limit):
+            if path not in starts:
+                starts[path] = line_starts(path)
+            line, column = locate(starts[path], offset)
+            print >> out, '  {0:.0f}  {1}  ({2}:{3})'.format(score, text,
+                                                            path, line)
+            print >> out, '      {0:.1f} per element, {1} elements{2}' \
+                          .format(cost, count, ''.join('; ' + r for r in why))
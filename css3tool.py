@@ -1,10 +1,25 @@
 from parser import CSSParser
+from document import Document
+from matcher import Matcher, SelectorCache
+from imports import ImportGraph
+from cache import ResultCache
+from watch import Watcher
+from timing import Profile, untimed
+from report import reports
+from prune import common_dir, prune_file
+from duplicates import Analysis
+from cost import CostReport
+from atrules import AtRuleUsage
+import cssselect
+import lxml.etree
 import re
-from lxml.cssselect import CSSSelector
-from lxml.html import fromstring
 import argparse
+import multiprocessing
+import cProfile
+import json
 import os.path
 import logging
+import sys
 
 logger = logging.getLogger()
 handler = logging.StreamHandler()
@@ -12,24 +27,504 @@ logger.addHandler(handler)
 formatter = logging.Formatter('[%(levelname)s] %(message)s')
 handler.setFormatter(formatter)
 
-def get_unused_selectors(css, html):
+# Parsers are expensive to build, so one is kept per debug and tokenizer
+# setting and shared by every call made in this process.
+parsers = {}
 
-    if logger.getEffectiveLevel() == logging.DEBUG:
-        debug = True
-    else:
-        debug = False
+def get_parser(debug=None, tabledir=None, fast=False):
+    if debug is None:
+        debug = logger.getEffectiveLevel() == logging.DEBUG
+    if (debug, fast) not in parsers:
+        with phase('build parser'):
+            parsers[debug, fast] = CSSParser(debug, tabledir, fast)
+    return parsers[debug, fast]
+
+# The matcher and its compiled selectors are shared by every stylesheet
+# and page in the run.
+matcher = Matcher()
+
+# The Profile of the run, with --profile.
+profile = None
+
+# The pages read_document has warned it can't parse.
+unparseable = set()
+
+# Changed whenever the selectors parsed from a stylesheet, or whether they
+# match a page, can change for the same content, so that results cached by
+# an older version are not reused.
+results_version = 3
+
+def phase(name, path=None):
+    """Times a phase of the run (see timing.Profile) if profiling."""
+    if profile is None:
+        return untimed
+    return profile.phase(name, path)
+
+def parsing(parser, path=None):
+    if profile is None:
+        return untimed
+    return profile.parsing(parser, path)
+
+def get_unused_selectors(css, html, parser=None):
+    """
+    Returns the selectors in the css string that match nothing in html,
+    which may be an HTML string, an lxml tree or a Document.
+    """
+
+    if parser is None:
+        parser = get_parser()
+
+    if not isinstance(html, Document):
+        html = Document(html)
 
-    parser = CSSParser(debug)
     parser.parse(css)
-    root = fromstring(html)
 
-    unused = []
-    for s in parser.selectors:
-        sel = CSSSelector(s)
-        if len(sel(root)) == 0:
-            unused.append(s)
+    used = matching(parser.selectors, html)
+    return [s for s in parser.selectors if s not in used]
+
+def matching(selectors, document):
+    """Returns the set of selectors that match an element of the document."""
+    if profile is None:
+        return matcher.matching(selectors, document)
+    with profile.phase('match', document.path):
+        return matcher.matching(selectors, document, profile.add_selector)
+
+def read_file(path):
+    with phase('read', path):
+        fh = open(path)
+        data = fh.read()
+        fh.close()
+    return data
+
+def read_document(path, html=None):
+    """
+    Parses the HTML page at path, unless its content html is given.
+    Returns None for a page lxml can't parse, such as an empty one, with
+    a warning the first time.
+    """
+    if html is None:
+        html = read_file(path)
+    with phase('parse html', path):
+        try:
+            return Document(html, path)
+        except lxml.etree.ParserError as e:
+            if path not in unparseable:
+                logging.warning('Skipping {0}: {1}'.format(path, e))
+                unparseable.add(path)
+            return None
+
+def get_selectors(css_path, parser, stream=False, cache=None):
+    """Returns the selectors of the CSS file at css_path (see parse_css)."""
+    return parse_css(css_path, parser, stream, cache)[0]
+
+def parse_css(css_path, parser, stream=False, cache=None):
+    """
+    Returns the selectors of the CSS file at css_path and the offsets of
+    their rules, as a pair of lists.  With stream, the file is read and
+    parsed a statement at a time rather than read whole.  If a ResultCache
+    is given, the file is only parsed if its content isn't in the cache.
+    """
+    if cache is not None:
+        key = cache.file_digest(css_path)
+        stylesheet = cache.get_stylesheet(key)
+        if stylesheet is None:
+            stylesheet = parse_css(css_path, parser, stream)
+            cache.put_stylesheet(key, *stylesheet)
+        return stylesheet
+
+    if stream:
+        fh = open(css_path)
+        try:
+            with parsing(parser, css_path):
+                for statement in parser.iterparse(fh):
+                    pass
+        finally:
+            fh.close()
+        warn_skipped(parser, css_path)
+    else:
+        parse_stylesheet(css_path, parser)
+    return list(parser.selectors), list(parser.offsets)
+
+def parse_stylesheet(css_path, parser):
+    """
+    Parses the CSS file at css_path whole and returns its text and its
+    Stylesheet node, for the analyses that work on the nodes.  The
+    parser's selectors and offsets are then those of the file.
+    """
+    data = read_file(css_path)
+    with parsing(parser, css_path):
+        stylesheet = parser.parse(data)
+    warn_skipped(parser, css_path)
+    return data, stylesheet
+
+def warn_skipped(parser, css_path):
+    if parser.skipped:
+        logging.warning('Skipped {0} unparseable part(s) of {1}'.format(
+                        len(parser.skipped), css_path))
+
+def check_stylesheets(css_paths, html, parser=None):
+    """
+    Checks every CSS file in css_paths against the same HTML document,
+    parsing the document only once.  Returns a dict mapping each path to
+    its list of unused selectors.
+    """
+    if not isinstance(html, Document):
+        html = Document(html)
+
+    result = {}
+    for css_path in css_paths:
+        result[css_path] = get_unused_selectors(css=read_file(css_path),
+                                                html=html, parser=parser)
+    return result
+
+def get_selector_hits(css_paths, html_paths, parser=None, early_exit=True,
+                      jobs=1, stream=False, selectors=None, cache=None,
+                      done=None, parsed=None):
+    """
+    Checks every CSS file in css_paths against every HTML page in
+    html_paths and returns a dict mapping each CSS file to a list of
+    (selector, number of pages matched) pairs in stylesheet order.
+
+    With early_exit, a selector is not checked again once it has matched
+    on any page, so its count is at most 1, and the remaining pages are
+    not even parsed once every selector has matched.  Without it, the
+    counts are exact.
+
+    With jobs > 1, the (page, stylesheet) pairs are shared out across a
+    pool of that many processes.  The result is identical to the serial
+    one.
+
+    With stream, stylesheets are parsed a statement at a time as they are
+    read (see get_selectors).  If selectors is given, it maps each CSS file
+    to its already parsed selectors, and the files are not parsed again.
+
+    If a ResultCache is given, stylesheets are only parsed, and selectors
+    only checked against pages, when the content of the stylesheet or the
+    page isn't in the cache.
+
+    If done is given, it is called with each CSS file and its list of
+    pairs as soon as they are final.  With early_exit, that is once every
+    selector of the file has matched, which may be long before the last
+    page has been checked.
+
+    If parsed is given, it is called with each Document the check parses,
+    so other work on the pages needn't parse them again.  Pages parsed by
+    the processes of jobs > 1 aren't passed to it.
+    """
+    if parser is None:
+        parser = get_parser()
+
+    # Parse each stylesheet once up front.  The same selector text shared
+    # by several stylesheets is only ever checked once per page.
+    if selectors is None:
+        selectors = {}
+        for css_path in css_paths:
+            selectors[css_path] = get_selectors(css_path, parser, stream,
+                                                cache)
+
+    if jobs > 1:
+        result = get_selector_hits_parallel(css_paths, html_paths, parser,
+                                            selectors, early_exit, jobs,
+                                            stream, cache)
+        if done is not None:
+            for css_path in css_paths:
+                done(css_path, result[css_path])
+        return result
+
+    hits = {}
+    for css_path in css_paths:
+        for s in selectors[css_path]:
+            hits[s] = 0
+    pending = set(hits)
+
+    def pairs(css_path):
+        return [(s, hits[s]) for s in selectors[css_path]]
+
+    # The CSS files not yet passed to done.
+    waiting = list(css_paths)
+
+    for html_path in html_paths:
+        if not pending:
+            break
+
+        if cache is None:
+            html = None
+            known = {}
+        else:
+            # The page is only parsed if a selector isn't in the cache.
+            html = read_file(html_path)
+            key = cache.digest(html)
+            known = cache.get_matches(key)
+
+        todo = [s for s in pending if s not in known]
+        if todo:
+            document = read_document(html_path, html)
+            if document is None:
+                continue
+            used = matching(todo, document)
+            for s in todo:
+                known[s] = s in used
+            if parsed is not None:
+                parsed(document)
+
+        for s in list(pending):
+            if known[s]:
+                hits[s] += 1
+                if early_exit:
+                    pending.remove(s)
+
+        if cache is not None and todo:
+            cache.put_matches(key, known)
+
+        if done is not None and early_exit:
+            still_waiting = []
+            for css_path in waiting:
+                if any(s in pending for s in selectors[css_path]):
+                    still_waiting.append(css_path)
+                else:
+                    done(css_path, pairs(css_path))
+            waiting = still_waiting
+
+    if done is not None:
+        for css_path in waiting:
+            done(css_path, pairs(css_path))
+
+    result = {}
+    for css_path in css_paths:
+        result[css_path] = pairs(css_path)
+    return result
+
+def follow_imports(css_paths, parser, stream=False, trees=None):
+    """
+    Returns the ImportGraph of the CSS files in css_paths and every local
+    file they @import, directly or not.  If trees is given, the files
+    parsed whole are added to it (see parse_stylesheet).
+    """
+    graph = ImportGraph(parser, stream, trees)
+    for css_path in css_paths:
+        graph.add(css_path)
+    return graph
+
+def parsed_stylesheets(css_paths, trees):
+    """
+    Returns the (path, text, Stylesheet node) tuple of each CSS file, from
+    trees, a dict of parse_stylesheet results.
+    """
+    return [(css_path,) + trees[css_path] for css_path in css_paths]
+
+def prune_stylesheets(css_paths, trees, hits, directory, parser, out,
+                      minified=False):
+    """
+    Writes a copy of each CSS file without its unused selectors to
+    directory, at its path relative to the directory holding them all, and
+    writes the number of bytes each copy saves to out.  With minified, the
+    copies are also minified (see minify.minify).
+    """
+    root = common_dir(css_paths)
+    before = after = 0
+    for css_path, data, stylesheet in parsed_stylesheets(css_paths, trees):
+        unused = set(s for s, n in hits[css_path] if n == 0)
+        target = os.path.join(directory, os.path.relpath(css_path, root))
+        with phase('prune', css_path):
+            size, pruned = prune_file(data, stylesheet, target, unused,
+                                      minified and parser.lexer or None)
+        print >> out, '{0}: {1} -> {2} bytes, {3} saved'.format(
+                      target, size, pruned, size - pruned)
+        before += size
+        after += pruned
+    print >> out, 'Total: {0} -> {1} bytes, {2} saved'.format(
+                  before, after, before - after)
+
+def find_duplicates(css_paths, trees, out, report=True, merge_path=None):
+    """
+    Writes the selectors, declarations and rule bodies that repeat across
+    the CSS files to out, taking the files in the order given as their
+    cascade order.  If merge_path is given, the files are also merged into
+    one stylesheet written there (see duplicates.Analysis.merge).
+    """
+    with phase('duplicates'):
+        analysis = Analysis(parsed_stylesheets(css_paths, trees))
+    if report:
+        analysis.report(out)
+    if merge_path:
+        with phase('merge'):
+            merged = analysis.merge()
+        fh = open(merge_path, 'w')
+        try:
+            fh.write(merged)
+        finally:
+            fh.close()
+        size = sum(len(data) for path, data, statements
+                   in analysis.stylesheets)
+        print >> out, '{0}: {1} -> {2} bytes, {3} saved'.format(
+                      merge_path, size, len(merged), size - len(merged))
+
+def find_expensive(costs, html_paths, out, limit):
+    """
+    Adds the pages that checking the selectors didn't parse to a
+    cost.CostReport, and writes the limit selectors that cost the most to
+    match on the pages to out.
+    """
+    with phase('cost'):
+        for html_path in html_paths:
+            if html_path not in costs.pages:
+                document = read_document(html_path)
+                if document is not None:
+                    costs.add(document)
+    costs.report(out, limit)
+
+def find_unused_at_rules(css_paths, trees, hits, out):
+    """
+    Writes the @font-face and @keyframes blocks of the CSS files that no
+    rule matching the pages uses to out (see atrules.AtRuleUsage).
+    """
+    used = set()
+    for css_path in css_paths:
+        used.update(s for s, n in hits[css_path] if n)
+    with phase('at-rules'):
+        usage = AtRuleUsage(parsed_stylesheets(css_paths, trees), used)
+    usage.report(out)
+
+# State kept by each worker process of the pool used by
+# get_selector_hits_parallel: the parser, the selectors of every
+# stylesheet it has seen and the page it is currently working on.
+worker = {}
+
+def init_worker(debug, tabledir, fast, stream):
+    # Only the main process is profiled.
+    global profile
+    profile = None
+    # The main process has already warned about anything worth it.
+    if not debug:
+        logger.setLevel(logging.ERROR)
+    worker['parser'] = get_parser(debug, tabledir, fast)
+    worker['stream'] = stream
+    worker['selectors'] = {}
+    worker['document'] = None
+
+def match_pair(pair):
+    """
+    Checks one stylesheet against one page in a worker process.  Returns
+    the pair along with a bitmap of the stylesheet's selectors that
+    matched, bit i being set if selector i matched.
+    """
+    html_path, css_path = pair
+
+    selectors = worker['selectors'].get(css_path)
+    if selectors is None:
+        selectors = worker['selectors'][css_path] = \
+            get_selectors(css_path, worker['parser'], worker['stream'])
+
+    # Pairs are handed out page by page, so keeping only the most recent
+    # page means each worker parses a page once for all its stylesheets.
+    document = worker['document']
+    if document is None or document.path != html_path:
+        document = worker['document'] = read_document(html_path)
+    if document is None:
+        return html_path, css_path, 0
+
+    used = matching(selectors, document)
+    bitmap = 0
+    for i, s in enumerate(selectors):
+        if s in used:
+            bitmap |= 1 << i
+    return html_path, css_path, bitmap
+
+def get_selector_hits_parallel(css_paths, html_paths, parser, selectors,
+                               early_exit, jobs, stream, cache):
+    counts = dict((css_path, [0] * len(selectors[css_path]))
+                  for css_path in css_paths)
 
-    return unused
+    def merge(css_path, bitmap):
+        for i, count in enumerate(counts[css_path]):
+            if bitmap >> i & 1:
+                counts[css_path][i] = count + 1
+
+    # Pairs whose selectors are all in the cache for the page are merged
+    # straight away; only the rest go to the pool.  The cache is only
+    # written to from this process.
+    keys = {}
+    known = {}
+    pairs = []
+    for html_path in html_paths:
+        if cache is not None:
+            keys[html_path] = cache.digest(read_file(html_path))
+            known[html_path] = cache.get_matches(keys[html_path])
+        for css_path in css_paths:
+            page = known.get(html_path, {})
+            if selectors[css_path] and \
+               all(s in page for s in selectors[css_path]):
+                bitmap = 0
+                for i, s in enumerate(selectors[css_path]):
+                    if page[s]:
+                        bitmap |= 1 << i
+                merge(css_path, bitmap)
+            else:
+                pairs.append((html_path, css_path))
+
+    chunksize = max(1, min(len(css_paths), len(pairs) // (jobs * 4)))
+    changed = set()
+
+    pool = multiprocessing.Pool(jobs, init_worker,
+                                (parser.debug, parser.tabledir, parser.fast,
+                                 stream))
+    try:
+        for html_path, css_path, bitmap in \
+                pool.imap_unordered(match_pair, pairs, chunksize):
+            merge(css_path, bitmap)
+            if cache is not None:
+                page = known[html_path]
+                for i, s in enumerate(selectors[css_path]):
+                    page[s] = bool(bitmap >> i & 1)
+                changed.add(html_path)
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    for html_path in changed:
+        cache.put_matches(keys[html_path], known[html_path])
+
+    # A selector shared by several stylesheets gets the same count in all
+    # of them, and with early_exit it is capped at 1, as in the serial path.
+    hits = {}
+    for css_path in css_paths:
+        for s, count in zip(selectors[css_path], counts[css_path]):
+            hits[s] = max(hits.get(s, 0), count)
+            if early_exit:
+                hits[s] = min(hits[s], 1)
+
+    result = {}
+    for css_path in css_paths:
+        result[css_path] = [(s, hits[s]) for s in selectors[css_path]]
+    return result
+
+def collect_paths(paths, extensions=None):
+    """
+    Converts paths to real paths, replaces each directory with the files
+    it contains recursively, in sorted order, and removes duplicates.
+    Paths keep the order they are given in, which is taken as the cascade
+    order of CSS files.  If extensions is given, only files with one of
+    those extensions are taken from directories; files named explicitly
+    are always kept.
+    """
+    collected = []
+    for path in paths:
+        path = os.path.realpath(path)
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path):
+                for file in files:
+                    if extensions and \
+                       os.path.splitext(file)[1].lower() not in extensions:
+                        continue
+                    found.append(os.path.join(root, file))
+            collected.extend(sorted(found))
+        else:
+            collected.append(path)
+    seen = set()
+    return [path for path in collected
+            if not (path in seen or seen.add(path))]
 
 if __name__ == '__main__':
 
@@ -43,22 +538,161 @@ if __name__ == '__main__':
               '  python css3tool.py index.html 1.css\n' \
               '  python css3tool.py index.html 1.css 2.css\n' \
               '  python css3tool.py index.html example/cssdir\n' \
-              '  python css3tool.py index.html 1.css example/cssdir' \
+              '  python css3tool.py index.html 1.css example/cssdir\n' \
+              '  python css3tool.py site/ example/cssdir\n' \
+              '  python css3tool.py index.html --html about.html 1.css' \
 
     argparser = argparse.ArgumentParser(description=desc, epilog=example,
                     formatter_class=argparse.RawDescriptionHelpFormatter)
     argparser.add_argument(dest='html',
-                           metavar='<HTML file>',
-                           type=argparse.FileType('r'),
-                           help='path to an HTML file')
+                           metavar='<HTML file or dir>',
+                           help='path to an HTML file or a directory of '
+                                'HTML files')
     argparser.add_argument(dest='css',
                            nargs='+',
                            metavar='<CSS file or dir>',
                            help='paths to a CSS files or directories')
+    argparser.add_argument('--html',
+                           dest='extra_html',
+                           action='append',
+                           default=[],
+                           metavar='<HTML file or dir>',
+                           help='additional HTML files or directories to '
+                                'check against (may be repeated)')
+    argparser.add_argument('--counts',
+                           dest='counts',
+                           action='store_true',
+                           help='count the pages each selector matches on '
+                                'instead of stopping at its first match')
+    argparser.add_argument('--format',
+                           dest='format',
+                           choices=['text'] + list(reports),
+                           default='text',
+                           help='output format: json, jsonl and csv give a '
+                                'record per selector with the line and '
+                                'column of its rule, written as each '
+                                'stylesheet is done (default: text)')
+    argparser.add_argument('--prune',
+                           dest='prune',
+                           metavar='<dir>',
+                           help='write copies of the CSS files without '
+                                'their unused selectors, and the rules and '
+                                '@media blocks left empty, to a directory')
+    argparser.add_argument('--minify',
+                           dest='minify',
+                           action='store_true',
+                           help='also minify the copies written by --prune: '
+                                'drop whitespace, comments and redundant '
+                                'semicolons, and shorten colors and zero '
+                                'lengths')
+    argparser.add_argument('--duplicates',
+                           dest='duplicates',
+                           action='store_true',
+                           help='list selectors used by several rules, '
+                                'declarations overridden by later rules and '
+                                'rules with identical bodies, across all the '
+                                'CSS files in the order given')
+    argparser.add_argument('--merge',
+                           dest='merge',
+                           metavar='<file>',
+                           help='write the CSS files merged into one, '
+                                'without overridden declarations and with '
+                                'duplicate rules folded together where the '
+                                'cascade allows')
+    argparser.add_argument('--expensive',
+                           dest='expensive',
+                           type=int,
+                           nargs='?',
+                           const=20,
+                           metavar='N',
+                           help='list the N selectors that cost the most to '
+                                'match, scored by their structure and the '
+                                'number of elements they are tested against '
+                                '(default: 20)')
+    argparser.add_argument('--unused-at-rules',
+                           dest='unused_at_rules',
+                           action='store_true',
+                           help='also list @font-face and @keyframes blocks '
+                                'that no rule matching the pages uses')
+    argparser.add_argument('--jobs',
+                           dest='jobs',
+                           type=int,
+                           default=1,
+                           metavar='N',
+                           help='number of processes to check pages and '
+                                'stylesheets with (default: 1)')
+    argparser.add_argument('--stream',
+                           dest='stream',
+                           action='store_true',
+                           help='read and parse CSS files a statement at a '
+                                'time, for very large stylesheets')
+    argparser.add_argument('--follow-imports',
+                           dest='follow_imports',
+                           action='store_true',
+                           help='also check the local files that CSS files '
+                                '@import, each reported on its own')
+    argparser.add_argument('--selector-cache',
+                           dest='selector_cache',
+                           metavar='<file>',
+                           help='file in which to keep CSS to XPath '
+                                'translations between runs')
+    argparser.add_argument('--cache-dir',
+                           dest='cache_dir',
+                           metavar='<dir>',
+                           help='directory in which to keep parsed '
+                                'stylesheets and match results between runs, '
+                                'so only changed files are reprocessed')
+    argparser.add_argument('--cache-size',
+                           dest='cache_size',
+                           type=int,
+                           default=256,
+                           metavar='MB',
+                           help='size the cache directory is trimmed to '
+                                'after each run (default: 256)')
+    argparser.add_argument('--watch',
+                           dest='watch',
+                           action='store_true',
+                           help='keep running, and report selectors that '
+                                'become unused or used as files change')
+    argparser.add_argument('--interval',
+                           dest='interval',
+                           type=float,
+                           default=0.5,
+                           metavar='<seconds>',
+                           help='how often --watch checks for changes '
+                                '(default: 0.5)')
+    argparser.add_argument('--profile',
+                           dest='profile',
+                           metavar='<file>',
+                           help='write the time spent in each phase of the '
+                                'run, per phase and per file, and the '
+                                'slowest selectors to a JSON file')
+    argparser.add_argument('--profile-slowest',
+                           dest='profile_slowest',
+                           type=int,
+                           default=10,
+                           metavar='N',
+                           help='number of slowest selectors listed by '
+                                '--profile (default: 10)')
+    argparser.add_argument('--profile-stats',
+                           dest='profile_stats',
+                           metavar='<file>',
+                           help='run under cProfile and dump its stats to '
+                                'a file, to be read with pstats')
+    argparser.add_argument('--fast-lexer',
+                           dest='fast',
+                           action='store_true',
+                           help='tokenize CSS with the hand-written '
+                                'tokenizer instead of the ply lexer')
     argparser.add_argument('--debug',
                            dest='debug',
                            action='store_true',
                            help='turns on debugging')
+    argparser.add_argument('--table-dir',
+                           dest='tabledir',
+                           metavar='<dir>',
+                           help='directory in which to cache the generated '
+                                'parse tables between runs')
 
     try:
         args = argparser.parse_args()
@@ -68,38 +702,178 @@ if __name__ == '__main__':
     if(args.debug):
        logger.setLevel(logging.DEBUG)
 
+    # --watch reads each file whole in this process and reports changes as
+    # text, so it can't honour options that change how that is done.
+    if args.watch:
+        ignored = [option for option, given in (
+                       ('--stream', args.stream),
+                       ('--follow-imports', args.follow_imports),
+                       ('--format', args.format != 'text'),
+                       ('--jobs', args.jobs > 1),
+                       ('--counts', args.counts),
+                       ('--prune', args.prune),
+                       ('--duplicates', args.duplicates),
+                       ('--merge', args.merge),
+                       ('--expensive', args.expensive is not None),
+                       ('--unused-at-rules', args.unused_at_rules))
+                   if given]
+        if ignored:
+            argparser.error("{0} can't be used with --watch".format(
+                            ', '.join(ignored)))
 
-    # HTML string
-    html_str = args.html.read()
+    if args.profile:
+        profile = Profile()
+        if args.jobs > 1:
+            logging.warning('--profile only times the main process, not '
+                            'the work done by --jobs')
+    if args.profile_stats:
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-    # Convert CSS paths provided as arguments to real path if necessary.
-    css_paths = []    
-    for css_path in args.css:
-        css_paths.append(os.path.realpath(css_path))
+    # Collect the HTML pages and CSS files, walking any directories given.
+    # Only .html and .htm files are taken from HTML directories.
+    with phase('collect paths'):
+        html_paths = collect_paths([args.html] + args.extra_html,
+                                   extensions=('.html', '.htm'))
+        css_paths = collect_paths(args.css)
 
-    # Traverse CSS paths provided as arguments.  If the path is a
-    # directory, add the files it contains recursively then remove
-    # the directory from the list.
-    for css_path in css_paths:
-        if os.path.isdir(css_path):
-            for root, dirs, files in os.walk(css_path):
-                for file in files:
-                    css_paths.append(os.path.join(root, file))
-            css_paths.remove(css_path)
+    for path in html_paths + css_paths:
+        if not os.path.isfile(path):
+            argparser.error("can't open '{0}'".format(path))
 
-    # Remove duplicate paths.
-    css_paths = list(set(css_paths))
+    if args.selector_cache:
+        matcher.cache = SelectorCache(path=args.selector_cache)
 
-    # Each list of unused selectors are stored in a dict
-    # with the CSS file being as the key.
-    # ie. {'/path/to/example.css': ['h1', 'h2']
-    result = {}
-    for css_path in css_paths:
-        fh = open(css_path)
-        css_str = fh.read()
+    # Build the parser once and reuse it for every CSS file.
+    parser = get_parser(args.debug, args.tabledir, args.fast)
+
+    if args.watch:
+        # Directories are walked again on every poll to pick up new files.
+        watcher = Watcher(lambda: collect_paths(args.css),
+                          lambda: collect_paths([args.html] + args.extra_html,
+                                                extensions=('.html', '.htm')),
+                          parser, matching)
+        watcher.run(args.interval)
+        argparser.exit()
+
+    cache = None
+    if args.cache_dir:
+        # Results are only reused with the same grammar, lxml and cssselect.
+        salt = '{0} {1} {2} {3}'.format(parser.grammar_hash(),
+                                        lxml.etree.__version__,
+                                        cssselect.__version__,
+                                        results_version)
+        cache = ResultCache(args.cache_dir, args.cache_size * 1024 * 1024,
+                            salt)
+
+    # The analyses run after the check work on the parsed stylesheets, so
+    # for them each file is parsed whole once, and its nodes kept in trees.
+    trees = None
+    if args.prune or args.duplicates or args.merge or args.expensive or \
+       args.unused_at_rules:
+        trees = {}
+
+    # Add every file imported by the CSS files.  Each file is parsed once
+    # and its selectors are reported under its own path.
+    if args.follow_imports:
+        with phase('follow imports'):
+            graph = follow_imports(css_paths, parser, args.stream, trees)
+        css_paths = sorted(graph.paths)
+        cascade = graph.order
+        selectors = graph.selectors
+        offsets = graph.offsets
+    else:
+        cascade = css_paths
+        selectors = {}
+        offsets = {}
+        for css_path in css_paths:
+            if trees is None or args.stream:
+                selectors[css_path], offsets[css_path] = \
+                    parse_css(css_path, parser, args.stream, cache)
+            else:
+                trees[css_path] = parse_stylesheet(css_path, parser)
+                selectors[css_path] = list(parser.selectors)
+                offsets[css_path] = list(parser.offsets)
+    if trees is not None:
+        # Files read a statement at a time still have to be parsed whole.
+        for css_path in css_paths:
+            if css_path not in trees:
+                trees[css_path] = parse_stylesheet(css_path, parser)
+
+    if args.merge and os.path.realpath(args.merge) in css_paths:
+        argparser.error('--merge would overwrite a CSS file')
+    if args.minify and not args.prune:
+        argparser.error('--minify is only used with --prune')
+    if args.prune and css_paths and \
+       os.path.realpath(args.prune) == common_dir(css_paths):
+        argparser.error('--prune would overwrite the CSS files')
+
+    # Records are written as each stylesheet is done, rather than at the end.
+    report = None
+    done = None
+    if args.format != 'text':
+        report = reports[args.format](sys.stdout, args.counts)
+        done = lambda css_path, pairs: report.add(css_path, pairs,
+                                                  offsets[css_path])
+
+    # Each page is parsed once and checked against every CSS file, and the
+    # cost of the selectors is added up on the pages as they are parsed.
+    costs = None
+    if args.expensive:
+        costs = CostReport(parsed_stylesheets(css_paths, trees))
+    hits = get_selector_hits(css_paths, html_paths, parser=parser,
+                             early_exit=not args.counts, jobs=args.jobs,
+                             stream=args.stream, selectors=selectors,
+                             cache=cache, done=done,
+                             parsed=costs and costs.add)
+
+    logging.debug(matcher.stats())
+    if cache is not None:
+        logging.debug(cache.stats())
+        cache.evict()
+    if args.selector_cache:
+        matcher.cache.save()
+
+    # The pruned copies are reported on stderr when stdout has the records.
+    if args.prune:
+        prune_stylesheets(css_paths, trees, hits, args.prune, parser,
+                          sys.stdout if report is None else sys.stderr,
+                          args.minify)
+    if args.duplicates or args.merge:
+        find_duplicates(cascade, trees,
+                        sys.stdout if report is None else sys.stderr,
+                        args.duplicates, args.merge)
+    if args.expensive:
+        find_expensive(costs, html_paths,
+                       sys.stdout if report is None else sys.stderr,
+                       args.expensive)
+    if args.unused_at_rules:
+        find_unused_at_rules(css_paths, trees, hits,
+                             sys.stdout if report is None else sys.stderr)
+
+    if args.profile_stats:
+        profiler.disable()
+        profiler.dump_stats(args.profile_stats)
+    if args.profile:
+        fh = open(args.profile, 'w')
+        json.dump(profile.report(args.profile_slowest), fh, indent=2)
         fh.close()
-        result[css_path] = get_unused_selectors(css=css_str, html=html_str)
 
-    print 'Unused Selectors:'
-    print result
+    if report is not None:
+        report.close()
+    elif args.counts:
+        # Each list of (selector, page count) pairs is stored in a dict
+        # with the CSS file being as the key.
+        # ie. {'/path/to/example.css': [('h1', 3), ('h2', 0)]}
+        print 'Selector Hits:'
+        print hits
+    else:
+        # Each list of unused selectors are stored in a dict
+        # with the CSS file being as the key.
+        # ie. {'/path/to/example.css': ['h1', 'h2']
+        result = {}
+        for css_path in css_paths:
+            result[css_path] = [s for s, n in hits[css_path] if n == 0]
 
+        print 'Unused Selectors:'
+        print result
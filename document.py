@@ -0,0 +1,88 @@
+from lxml.html import fromstring
+
+class Document:
+    """
+    An HTML document parsed once by lxml.
+
+    Parsing a large page costs far more than checking a stylesheet against
+    it, so a Document is built once per page and handed to every
+    stylesheet that needs to be checked against that page.
+    """
+
+    def __init__(self, html, path=None):
+        if isinstance(html, basestring):
+            html = fromstring(html)
+        elif hasattr(html, 'getroot'):
+            html = html.getroot()
+        self.root = html
+        self.path = path
+        self._index = None
+
+    @property
+    def index(self):
+        """The ElementIndex of this document, built on first use."""
+        if self._index is None:
+            self._index = ElementIndex(self.root)
+        return self._index
+
+    @classmethod
+    def from_file(cls, path):
+        fh = open(path)
+        html = fh.read()
+        fh.close()
+        return cls(html, path)
+
+class ElementIndex:
+    """
+    The ids, class names, tag names and attribute names present in a
+    document, collected in a single pass over its elements.  Each is
+    held in a dict with the number of elements that have it, and elements
+    is the number of elements in the document.
+
+    A selector can only match if every id, class, tag and attribute its
+    rightmost compound selector requires is present somewhere in the
+    document, so most selectors can be ruled out without evaluating them.
+    """
+
+    def __init__(self, root):
+        self.ids = {}
+        self.classes = {}
+        self.tags = {}
+        self.attributes = {}
+        self.elements = 0
+
+        for el in root.iter():
+            # Comments and processing instructions have no string tag.
+            if not isinstance(el.tag, basestring):
+                continue
+            self.elements += 1
+            self.tags[el.tag] = self.tags.get(el.tag, 0) + 1
+            for name, value in el.attrib.items():
+                self.attributes[name] = self.attributes.get(name, 0) + 1
+                if name == 'id':
+                    self.ids[value] = self.ids.get(value, 0) + 1
+                elif name == 'class':
+                    for cls in set(value.split()):
+                        self.classes[cls] = self.classes.get(cls, 0) + 1
+
+    def may_match(self, requirements):
+        """
+        Returns False if the requirements of a compound selector (as
+        returned by matcher.rightmost_requirements) cannot be met by this
+        document, True if they might be.
+        """
+        if requirements is None:
+            return True
+        tag, ids, classes, attributes = requirements
+        if tag is not None and tag not in self.tags:
+            return False
+        for id in ids:
+            if id not in self.ids:
+                return False
+        for cls in classes:
+            if cls not in self.classes:
+                return False
+        for name in attributes:
+            if name not in self.attributes:
+                return False
+        return True
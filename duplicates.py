@@ -0,0 +1,366 @@
+"""
+Finds the rulesets of stylesheets that repeat each other: selectors used
+by more than one ruleset, declarations that later rulesets override and
+rulesets with the same body.  Stylesheets are taken in cascade order, as
+if concatenated into one bundle, and rulesets are only compared with
+those under the same @media and @supports conditions.
+
+A merged bundle can also be written, with the overridden declarations
+taken out and rulesets folded into later ones where that can't change
+the cascade (see merge).
+"""
+from imports import resolve
+from nodes import Import, Media, Supports
+import os.path
+from prune import apply_cuts, cut_statement
+from report import line_starts, locate
+
+# The pseudo-classes and pseudo-elements of CSS 2 and Selectors Level 3,
+# which every browser knows.  A browser drops a whole ruleset if one of
+# its selectors has a pseudo it doesn't know, such as '::-moz-placeholder'
+# outside Firefox, so selectors with any other are never grouped together.
+standard_pseudos = frozenset(['root', 'nth-child', 'nth-last-child',
+                              'nth-of-type', 'nth-last-of-type',
+                              'first-child', 'last-child', 'first-of-type',
+                              'last-of-type', 'only-child', 'only-of-type',
+                              'empty', 'link', 'visited', 'active', 'hover',
+                              'focus', 'target', 'lang', 'enabled',
+                              'disabled', 'checked', 'first-line',
+                              'first-letter', 'before', 'after'])
+
+def standard(selector):
+    """
+    Returns True if a Selector node has no pseudo-classes or
+    pseudo-elements other than those in standard_pseudos.
+    """
+    compounds = list(selector.compounds)
+    for compound in selector.compounds:
+        compounds.extend(n.argument for n in compound.negations)
+    return all(pseudo.name.lower() in standard_pseudos
+               for compound in compounds for pseudo in compound.pseudos)
+
+class Entry:
+    """
+    A ruleset with selectors, with the (text, source) pair of each
+    selector and the (Declaration, source) pair of each declaration it
+    still has.  standard is True if none of its selectors has a pseudo a
+    browser might not know (see standard_pseudos).
+    """
+
+    def __init__(self, path, data, rule, context):
+        self.path = path
+        self.data = data
+        self.rule = rule
+        self.context = context
+        group = rule.selectors
+        self.selectors = [(s.text, data[s.start:s.end])
+                          for s in group.selectors]
+        self.standard = all(standard(s) for s in group.selectors)
+        self.declarations = [(d, data[d.start:d.end])
+                             for d in rule.declarations]
+        self.brace = data.index('{', group.end)
+        self.changed = False
+        self.removed = False
+
+    def texts(self):
+        return set(text for text, source in self.selectors)
+
+    def body(self):
+        return self.data[self.brace + 1:self.rule.end - 1].strip()
+
+    def families(self):
+        return set(family(d.property) for d, source in self.declarations)
+
+    def text(self):
+        """Returns the ruleset as it is written to a merged bundle."""
+        selectors = ', '.join(source for text, source in self.selectors)
+        rule = self.rule
+        if [d for d, source in self.declarations] == rule.declarations:
+            return selectors + self.data[rule.selectors.end:rule.end]
+        lines = ['    {0};\n'.format(source)
+                 for d, source in self.declarations]
+        return selectors + ' {\n' + ''.join(lines) + '}'
+
+# Properties set by shorthands whose names don't start with theirs.
+shorthand_families = {'top': 'inset', 'right': 'inset', 'bottom': 'inset',
+                      'left': 'inset', 'align': 'place', 'justify': 'place',
+                      'column': 'grid', 'row': 'grid', 'gap': 'grid'}
+
+def family(name):
+    """
+    Returns the group of properties that name is one of, those that can
+    set each other, ie. 'margin' for 'margin-top' and 'margin'.
+    """
+    name = name.lower()
+    if name.startswith('-'):
+        name = name[name.find('-', 1) + 1:]
+    name = name.split('-')[0]
+    return shorthand_families.get(name, name)
+
+def conflict(families, others):
+    """Returns True if any of two sets of property families can clash."""
+    return bool(families & others) or 'all' in families or 'all' in others
+
+def describe(context):
+    return context and ' (' + ' '.join(context) + ')' or ''
+
+class Analysis:
+    """
+    The rulesets of a list of stylesheets, given in cascade order as
+    (path, text, Stylesheet node) tuples, and what repeats among them.
+    Each ruleset is an Entry in entries, in cascade order.  siblings holds
+    the rulesets sharing a parent, where the parent of top level rulesets
+    is the whole bundle; an @media or @supports block among them stands
+    for the set of property families its rulesets set.
+    """
+
+    def __init__(self, stylesheets):
+        self.entries = []
+        self.siblings = []
+        self.stylesheets = []
+        self.starts = {}
+        self.bundled = set(os.path.realpath(path)
+                           for path, data, stylesheet in stylesheets)
+        top = []
+        self.siblings.append(top)
+        for css_path, data, stylesheet in stylesheets:
+            statements = stylesheet.statements
+            self.stylesheets.append((css_path, data, statements))
+            self.collect(css_path, data, statements, (), top)
+        self.overridden = self.find_overridden()
+
+    def collect(self, path, data, statements, context, siblings):
+        """
+        Adds the rulesets among statements to entries and siblings, and
+        returns the families of the properties they set.
+        """
+        families = set()
+        for statement in statements:
+            if isinstance(statement, (Media, Supports)):
+                if isinstance(statement, Media):
+                    condition = '@media ' + ', '.join(statement.queries)
+                else:
+                    condition = '@supports ' + statement.condition
+                inner = []
+                self.siblings.append(inner)
+                block = self.collect(path, data, statement.rules,
+                                     context + (condition,), inner)
+                siblings.append(block)
+                families |= block
+            elif getattr(statement, 'selectors', None) is not None:
+                entry = Entry(path, data, statement, context)
+                self.entries.append(entry)
+                siblings.append(entry)
+                families |= entry.families()
+        return families
+
+    def find_overridden(self):
+        """
+        Returns the (Entry, Declaration) pairs of the declarations that
+        lose to another declaration of the same property for every one of
+        their selectors: to a later one, or to an !important one wherever
+        it is.  A declaration overridden within its own ruleset by a later
+        one with a different value is taken as a fallback for older
+        browsers, as in 'display: -webkit-box; display: flex', and kept.
+
+        A ruleset with a pseudo a browser might not know overrides nothing,
+        as the browsers that don't know it drop the whole ruleset.
+        """
+        # The position of the first !important declaration of each
+        # (context, selector, property).
+        important = {}
+        position = 0
+        for entry in self.entries:
+            for declaration, source in entry.declarations:
+                position += 1
+                if declaration.important and entry.standard:
+                    name = declaration.property.lower()
+                    for text in entry.texts():
+                        important.setdefault((entry.context, text, name),
+                                             position)
+
+        latest = {}         # (context, selector, property) -> declaration
+        overridden = []
+        for entry in reversed(self.entries):
+            for declaration, source in reversed(entry.declarations):
+                name = declaration.property.lower()
+                keys = [(entry.context, text, name) for text in entry.texts()]
+                covered = True
+                for key in keys:
+                    if not declaration.important and \
+                       important.get(key, position) < position:
+                        continue
+                    other = latest.get(key)
+                    if other is None or \
+                       declaration.important and not other[1].important or \
+                       other[0] is entry and \
+                       other[1].value != declaration.value:
+                        covered = False
+                if covered:
+                    overridden.append((entry, declaration))
+                for key in entry.standard and keys or []:
+                    other = latest.get(key)
+                    if other is None or \
+                       declaration.important and not other[1].important:
+                        latest[key] = (entry, declaration)
+                position -= 1
+        overridden.reverse()
+        return overridden
+
+    def duplicate_selectors(self):
+        """
+        Returns the selectors used by more than one ruleset, as a list of
+        (selector, context, entries) tuples.
+        """
+        found = {}
+        for entry in self.entries:
+            for text in entry.texts():
+                found.setdefault((entry.context, text), []).append(entry)
+        return [(text, context, entries)
+                for (context, text), entries in sorted(found.items())
+                if len(entries) > 1]
+
+    def identical_bodies(self):
+        """
+        Returns the groups of rulesets whose bodies are byte for byte the
+        same, as lists of entries.
+        """
+        found = {}
+        order = []
+        for entry in self.entries:
+            body = entry.body()
+            if not body:
+                continue
+            key = (entry.context, body)
+            if key not in found:
+                found[key] = []
+                order.append(key)
+            found[key].append(entry)
+        return [found[key] for key in order if len(found[key]) > 1]
+
+    def where(self, entry, offset=None):
+        """Returns 'path:line' for an offset of entry, its rule by default."""
+        if entry.path not in self.starts:
+            self.starts[entry.path] = line_starts(entry.path)
+        if offset is None:
+            offset = entry.rule.start
+        line, column = locate(self.starts[entry.path], offset)
+        return '{0}:{1}'.format(entry.path, line)
+
+    def report(self, out):
+        """Writes what repeats among the rulesets to out."""
+        print >> out, 'Duplicate Selectors:'
+        for text, context, entries in self.duplicate_selectors():
+            print >> out, '  {0}{1}: {2}'.format(
+                          text, describe(context),
+                          ', '.join(self.where(e) for e in entries))
+        print >> out, 'Overridden Declarations:'
+        for entry, declaration in self.overridden:
+            print >> out, '  {0}: {1} {{ {2} }}{3}'.format(
+                          self.where(entry, declaration.start),
+                          ', '.join(s for s, source in entry.selectors),
+                          entry.data[declaration.start:declaration.end],
+                          describe(entry.context))
+        print >> out, 'Identical Rule Bodies:'
+        for entries in self.identical_bodies():
+            print >> out, '  ' + ', '.join(
+                          '{0} ({1})'.format(self.where(e), ', '.join(
+                              s for s, source in e.selectors))
+                          for e in entries)
+
+    def merge(self):
+        """
+        Returns the stylesheets concatenated, without the overridden
+        declarations, and with rulesets folded into later ones: a ruleset
+        into a later one with the same selectors, whose declarations then
+        follow its own, or into a later one with the same body, whose
+        selectors then follow its own, unless either has a pseudo a
+        browser might not know.  A ruleset is only moved past
+        rulesets that set none of the same property families, so which
+        declaration wins for any element and property stays the same.
+        Rulesets and blocks left empty are taken out, and so are the
+        @import rules of stylesheets that are part of the bundle.
+        """
+        dropped = set(id(declaration) for entry, declaration
+                      in self.overridden)
+        for entry in self.entries:
+            kept = [(d, source) for d, source in entry.declarations
+                    if id(d) not in dropped]
+            if len(kept) < len(entry.declarations):
+                entry.declarations = kept
+                entry.changed = True
+                entry.removed = not kept
+
+        for siblings in self.siblings:
+            self.fold(siblings)
+
+        entries = dict((id(entry.rule), entry) for entry in self.entries)
+        parts = []
+        for css_path, data, statements in self.stylesheets:
+            cuts = []
+            self.cut(css_path, data, statements, entries, cuts)
+            text = apply_cuts(data, cuts)
+            if text and not text.endswith('\n'):
+                text += '\n'
+            parts.append(text)
+        return ''.join(parts)
+
+    def fold(self, siblings):
+        """Folds the rulesets of a list of siblings into later ones."""
+        for i, entry in enumerate(siblings):
+            if not isinstance(entry, Entry) or entry.removed or \
+               not entry.declarations:
+                continue
+            families = entry.families()
+            for other in siblings[i + 1:]:
+                if not isinstance(other, Entry):
+                    if conflict(families, other):
+                        break
+                    continue
+                if other.removed:
+                    continue
+                if other.texts() == entry.texts():
+                    other.declarations = entry.declarations + \
+                                         other.declarations
+                elif entry.standard and other.standard and \
+                     [s for d, s in other.declarations] == \
+                     [s for d, s in entry.declarations]:
+                    other.selectors = entry.selectors + \
+                        [s for s in other.selectors if s[0] not in
+                         entry.texts()]
+                else:
+                    if conflict(families, other.families()):
+                        break
+                    continue
+                other.changed = True
+                entry.removed = True
+                break
+
+    def cut(self, path, data, statements, entries, cuts):
+        """
+        Adds the cuts that write the merged rulesets among statements, and
+        returns True if nothing would be left of them.
+        """
+        left = False
+        for statement in statements:
+            rules = getattr(statement, 'rules', None)
+            if rules and self.cut(path, data, rules, entries, cuts):
+                while cuts and cuts[-1][0] >= statement.start:
+                    cuts.pop()
+                cut_statement(data, statement, cuts)
+                continue
+            if isinstance(statement, Import) and \
+               resolve(statement.url, path) in self.bundled:
+                cut_statement(data, statement, cuts)
+                continue
+            entry = entries.get(id(statement))
+            if entry is None:
+                left = True
+            elif entry.removed:
+                cut_statement(data, statement, cuts)
+            else:
+                left = True
+                if entry.changed:
+                    cuts.append((statement.start, statement.end,
+                                 entry.text()))
+        return not left
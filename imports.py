@@ -0,0 +1,97 @@
+from nodes import Import
+import logging
+import os.path
+import re
+import urllib
+
+# URLs with a scheme (http:, data:, ...) or a host can't be read locally.
+remote = re.compile(r'^([a-z][a-z0-9+.-]*:|//)', re.IGNORECASE)
+
+def resolve(url, importer):
+    """
+    Returns the real path of the local file that url refers to when
+    @imported from the file importer, or None if url isn't a local path.
+    """
+    url = url.split('#')[0].split('?')[0]
+    if not url or remote.match(url) or url.startswith('/'):
+        return None
+    path = os.path.join(os.path.dirname(importer), urllib.unquote(url))
+    return os.path.realpath(path)
+
+class ImportGraph:
+    """
+    The stylesheets reachable from a set of CSS files through local
+    @import rules.
+
+    Each file is parsed exactly once, however many files import it.
+    paths lists the files in the order they were found, and order lists
+    them in cascade order, each after the files it imports.  selectors
+    maps each file to the selectors it defines itself, offsets
+    maps it to the offsets of their rules, imports maps it to the files it
+    imports, and cycles lists every chain of imports that leads back to a
+    file already being imported.  If a trees dict is given, each file not
+    parsed with stream is added to it, mapping its path to its text and
+    its Stylesheet node.
+    """
+
+    def __init__(self, parser, stream=False, trees=None):
+        self.parser = parser
+        self.stream = stream
+        self.trees = trees
+        self.paths = []
+        self.order = []
+        self.selectors = {}
+        self.offsets = {}
+        self.imports = {}
+        self.cycles = []
+
+    def add(self, path, stack=None):
+        """Adds the file at path and everything it imports to the graph."""
+        path = os.path.realpath(path)
+        if stack is None:
+            stack = []
+        if path in stack:
+            cycle = stack[stack.index(path):] + [path]
+            self.cycles.append(cycle)
+            logging.warning('Import cycle: {0}'.format(' -> '.join(cycle)))
+            return
+        if path in self.selectors:
+            return
+
+        imports = self.parse_imports(path)
+        self.paths.append(path)
+        self.selectors[path] = list(self.parser.selectors)
+        self.offsets[path] = list(self.parser.offsets)
+        self.imports[path] = []
+
+        stack.append(path)
+        for statement in imports:
+            imported = resolve(statement.url, path)
+            if imported is None:
+                logging.debug('Not following import of {0} in {1}'.format(
+                              statement.url, path))
+            elif not os.path.isfile(imported):
+                logging.warning('Missing import {0} in {1}'.format(
+                                statement.url, path))
+            else:
+                self.imports[path].append(imported)
+                self.add(imported, stack)
+        stack.pop()
+        # The rules of the imported files come before those of the file.
+        self.order.append(path)
+
+    def parse_imports(self, path):
+        """Parses the file at path and returns its Import nodes."""
+        fh = open(path)
+        try:
+            if self.stream:
+                statements = self.parser.iterparse(fh)
+            else:
+                data = fh.read()
+                stylesheet = self.parser.parse(data)
+                if self.trees is not None:
+                    self.trees[path] = (data, stylesheet)
+                statements = stylesheet.statements
+            return [s for s in statements if isinstance(s, Import)]
+        finally:
+            fh.close()
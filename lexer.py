@@ -44,6 +44,9 @@ class CSSLexer:
 
     def __init__(self, debug=False):
         self.lexer = lex.lex(module=self, reflags=re.IGNORECASE, debug=debug)
+        # Added to the position of every token, for input that starts
+        # part way through a file.
+        self.offset = 0
 
     ############################################################
     #################### Token Definitions #####################
@@ -51,7 +54,7 @@ class CSSLexer:
 
 
     literals = ['|', '*', '[', ']', '=', '+', '>', '~',
-                '.', ',', '-', ':', '{', '}', ',', ';', '(', ')']
+                '.', ',', '-', ':', '{', '}', ',', ';', '(', ')', '/']
     tokens = []
 
 
@@ -119,6 +122,10 @@ class CSSLexer:
     def t_PERCENTAGE(self, t): return t
     t_PERCENTAGE.__doc__ = r'{0}\%'.format(num)
 
+    tokens.append('IMPORTANT_SYM')
+    def t_IMPORTANT_SYM(self, t): return t
+    t_IMPORTANT_SYM.__doc__ = r'!{0}important'.format(w)
+
 
     ############################################################
     ### At-keywords
@@ -148,6 +155,26 @@ class CSSLexer:
         r'\@media'
         return t
 
+    tokens.append('CHARSET_SYM')
+    def t_CHARSET_SYM(self, t):
+        r'\@charset'
+        return t
+
+    tokens.append('SUPPORTS_SYM')
+    def t_SUPPORTS_SYM(self, t):
+        r'\@supports'
+        return t
+
+    # With or without a vendor prefix, ie. @-webkit-keyframes.
+    tokens.append('KEYFRAMES_SYM')
+    def t_KEYFRAMES_SYM(self, t): return t
+    t_KEYFRAMES_SYM.__doc__ = r'\@(-[a-z]+-)?keyframes(?!{0})'.format(nmchar)
+
+    # Any other at-rule, which the parser skips.
+    tokens.append('ATKEYWORD')
+    def t_ATKEYWORD(self, t): return t
+    t_ATKEYWORD.__doc__ = r'\@{0}'.format(ident)
+
 
     ############################################################
     ### Comments
@@ -174,20 +201,18 @@ class CSSLexer:
     def t_STRING(self, t): return t
     t_STRING.__doc__ = r'{0}'.format(string)
 
+    # Only whole words, so 'only-child' or 'notice' is an IDENT.
     tokens.append('ONLY')
-    def t_ONLY(self, t):
-        r'only'
-        return t
+    def t_ONLY(self, t): return t
+    t_ONLY.__doc__ = r'only(?!{0})'.format(nmchar)
 
     tokens.append('AND')
-    def t_AND(self, t):
-        r'and'
-        return t
+    def t_AND(self, t): return t
+    t_AND.__doc__ = r'and(?!{0})'.format(nmchar)
 
     tokens.append('NOT')
-    def t_NOT(self, t):
-        r'not'
-        return t
+    def t_NOT(self, t): return t
+    t_NOT.__doc__ = r'not(?!{0})'.format(nmchar)
 
     tokens.append('IDENT')
     def t_IDENT(self, t): return t
@@ -202,9 +227,34 @@ class CSSLexer:
         t.lexer.lineno += len(t.value)
 
     def t_error(self, t):
-        print "Illegal character '{0}'".format(t.value[0])
+        # Logged rather than printed, to keep machine-readable output clean.
+        logging.warning("Illegal character '{0}'".format(t.value[0]))
         t.lexer.skip(1)
     
+    def token(self):
+        """
+        Returns the next token, with the offset just past its end set as
+        endlexpos so the parser can work out where each rule ends.
+        """
+        tok = self.lexer.token()
+        if tok:
+            tok.lexpos += self.offset
+            tok.endlexpos = tok.lexpos + len(tok.value)
+        return tok
+
+    def trace(self):
+        """
+        Returns a token function for the parser that logs each token as the
+        parser reads it, so tracing costs no second pass over the input.
+        """
+        token = self.token
+        def traced_token():
+            tok = token()
+            if tok:
+                logging.debug(tok)
+            return tok
+        return traced_token
+
     def debug(self, data):
         self.lexer.input(data)
         while True:
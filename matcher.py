@@ -0,0 +1,639 @@
+from collections import OrderedDict
+from lxml import etree
+from lxml.cssselect import LxmlTranslator
+from cssselect.parser import Selector, Element, Hash, Class, Attrib, \
+                             Pseudo, Negation, CombinedSelector
+import cssselect
+import json
+import logging
+import os
+import re
+import time
+
+# The translator lxml's CSSSelector uses.
+translator = LxmlTranslator()
+
+def translate(selector):
+    """
+    Returns the XPath translation of selector as a (contexts, path) pair.
+    If selector is a single compound selector, contexts is None and path
+    is the same as CSSSelector's.  Otherwise contexts finds the elements
+    its leftmost compound selector matches, and path is the selector
+    evaluated from one of those elements.
+    """
+    parsed = cssselect.parse(selector)
+    if len(parsed) != 1 or parsed[0].pseudo_element or \
+       not isinstance(parsed[0].parsed_tree, CombinedSelector):
+        return None, translator.css_to_xpath(selector)
+
+    node = parsed[0].parsed_tree
+    while isinstance(node, CombinedSelector):
+        node = node.selector
+    return (translator.selector_to_xpath(Selector(node)),
+            translator.selector_to_xpath(parsed[0], prefix='self::'))
+
+class FirstMatch:
+    """
+    A selector compiled to XPath that only finds out whether it matches
+    an element under a root, rather than collecting every element it
+    matches.
+
+    libxml2 evaluates a path of several steps, such as that of 'div span',
+    by building the full node-set of every step and removing duplicates
+    as it goes, which for broad selectors on large pages takes far longer
+    than finding one match.  So the elements the leftmost compound
+    selector matches are found first, and the rest of the selector is
+    evaluated from each of them in turn, stopping at the first match.
+    """
+
+    def __init__(self, contexts, path):
+        self.contexts = None
+        if contexts is not None:
+            self.contexts = etree.XPath(contexts)
+        self.path = etree.XPath('boolean({0})'.format(path))
+
+    def __call__(self, root):
+        if self.contexts is None:
+            return self.path(root)
+        for context in self.contexts(root):
+            if self.path(context):
+                return True
+        return False
+
+# Changed whenever what a selector cache file holds changes.
+cache_format = 2
+
+class SelectorCache:
+    """
+    A bounded LRU cache of compiled selectors keyed by selector text.
+
+    Shared frameworks repeat the same selectors across many stylesheets,
+    and each is checked against many pages, so translating a selector to
+    XPath and compiling it once per run saves a lot of repeated work.
+
+    The CSS to XPath translations can also be kept in a JSON file between
+    runs, in which case only the (cheap) XPath compilation is repeated.
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.compiled = OrderedDict()
+        self.translations = {}
+        self.hits = 0
+        self.misses = 0
+        if path:
+            self.load()
+
+    def get(self, selector):
+        """Returns the FirstMatch for the selector text."""
+        try:
+            sel = self.compiled.pop(selector)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            translation = self.translations.get(selector)
+            if translation is None:
+                translation = self.translations[selector] = \
+                    translate(selector)
+            sel = FirstMatch(*translation)
+            if len(self.compiled) >= self.maxsize:
+                self.compiled.popitem(last=False)
+        self.compiled[selector] = sel
+        return sel
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        fh = open(self.path)
+        try:
+            data = json.load(fh)
+        except ValueError:
+            logging.debug('Ignoring unreadable selector cache {0}'.format(
+                          self.path))
+            return
+        finally:
+            fh.close()
+
+        # Translations made by another version of cssselect may differ.
+        if data.get('cssselect') == cssselect.__version__ and \
+           data.get('format') == cache_format:
+            self.translations.update(data['translations'])
+
+    def save(self):
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        fh = open(tmp_path, 'w')
+        json.dump({'cssselect': cssselect.__version__,
+                   'format': cache_format,
+                   'translations': self.translations}, fh)
+        fh.close()
+        os.rename(tmp_path, self.path)
+
+    def stats(self):
+        return 'selector cache: {0} hits, {1} misses, {2} compiled, ' \
+               '{3} translations'.format(self.hits, self.misses,
+                                         len(self.compiled),
+                                         len(self.translations))
+
+# The attribute name at the start of an attribute selector such as
+# [foo], [foo="bar"] or [foo|="en"].  Namespaced names don't match.
+attribute_name = re.compile(r'\[\s*([^\s~|^$*=\]]+)\s*(\]|[~|^$*]?=)')
+
+def rightmost_compound(selector):
+    """Returns the text of the last compound selector in selector."""
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(selector):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif depth == 0 and c in ' \t\n>+~':
+            start = i + 1
+    return selector[start:]
+
+def split_compound(compound):
+    """
+    Splits a compound selector into its simple selectors, ie.
+    'a.b[c="d"]:not(.e)' gives ['a', '.b', '[c="d"]', ':not(.e)'].
+    """
+    parts = []
+    depth = 0
+    quote = None
+    start = 0
+    for i, c in enumerate(compound):
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '([':
+            if depth == 0 and c == '[' and i > start:
+                parts.append(compound[start:i])
+                start = i
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif depth == 0 and c in '#.:' and i > start:
+            parts.append(compound[start:i])
+            start = i
+    parts.append(compound[start:])
+    return parts
+
+# Pseudo-classes for states a page is only in while it is being used,
+# which cssselect's XPath never matches, and the pseudo-elements that can
+# be written with a single colon.  A rule using them applies if its
+# selector matches an element without them, so they are left out when
+# checking selectors, as is any pseudo-element written with two colons.
+dynamic = frozenset(['link', 'visited', 'hover', 'active', 'focus',
+                     'focus-within', 'focus-visible', 'target', 'enabled',
+                     'disabled', 'checked', 'before', 'after', 'first-line',
+                     'first-letter'])
+pseudo_name = re.compile(r'::?(-?[_a-zA-Z][-_a-zA-Z0-9]*)(\()?')
+
+def static_selector(selector):
+    """
+    Returns selector without its pseudo-elements and dynamic pseudo-classes,
+    ie. 'a:hover > :focus::before' gives 'a > *'.  Functions such as
+    :not() are kept whole.
+    """
+    if ':' not in selector:
+        return selector
+    out = []
+    depth = 0
+    quote = None
+    i = 0
+    while i < len(selector):
+        c = selector[i]
+        if quote:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c in '([':
+            depth += 1
+        elif c in ')]':
+            depth -= 1
+        elif c == ':' and depth == 0:
+            match = pseudo_name.match(selector, i)
+            if match and not match.group(2) and \
+               (selector.startswith('::', i) or
+                match.group(1).lower() in dynamic):
+                i = match.end()
+                # A compound left with nothing in it matches any element.
+                if (not out or out[-1] in ' \t\n>+~') and \
+                   (i == len(selector) or selector[i] in ' \t\n>+~'):
+                    out.append('*')
+                continue
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+def rightmost_requirements(selector):
+    """
+    Returns a (tag, ids, classes, attributes) tuple describing what an
+    element must have to be matched by the rightmost compound selector of
+    selector: a tag name (or None for any), and the lists of ids, class
+    names and attribute names it needs.  Returns None if that can't be
+    worked out cheaply, ie. for escapes or namespaces.
+    """
+    compound = rightmost_compound(selector)
+    if not compound or '\\' in compound:
+        return None
+
+    tag = None
+    ids = []
+    classes = []
+    attributes = []
+    for i, part in enumerate(split_compound(compound)):
+        if part[0] == '#':
+            ids.append(part[1:])
+        elif part[0] == '.':
+            classes.append(part[1:])
+        elif part[0] == '[':
+            match = attribute_name.match(part)
+            if not match:
+                return None
+            attributes.append(match.group(1))
+        elif part[0] == ':':
+            # Pseudo-classes and negations only narrow down a match.
+            continue
+        elif i == 0 and '|' not in part:
+            if part != '*':
+                tag = part
+        else:
+            return None
+    return tag, ids, classes, attributes
+
+# What XPath's normalize-space() counts as whitespace, which is what class
+# names are split on by the XPath cssselect generates.
+whitespace = re.compile(r'[ \t\r\n]+')
+
+def words(value):
+    return whitespace.split(value.strip(' \t\r\n'))
+
+def is_element(el):
+    # Comments and processing instructions have no string tag.
+    return isinstance(el.tag, basestring)
+
+# Each test below is a function of an element that gives the same answer
+# as the XPath condition cssselect's translator generates for it.  [a!=b]
+# is left to XPath, as the condition generated for it is only the first
+# half of an 'or', which the conditions after it are and-ed onto.
+
+def attribute_test(name, operator, value):
+    if operator == 'exists':
+        return lambda el: el.get(name) is not None
+    if operator == '=':
+        return lambda el: el.get(name) == value
+    if operator == '|=':
+        return lambda el: el.get(name) is not None and \
+                          (el.get(name) == value or
+                           el.get(name).startswith(value + '-'))
+    if operator == '~=':
+        if not value or re.search(r'[ \t\r\n\f]', value):
+            return lambda el: False
+        return lambda el: el.get(name) is not None and \
+                          value in words(el.get(name))
+    if not value:
+        return lambda el: False
+    if operator == '^=':
+        return lambda el: (el.get(name) or '').startswith(value)
+    if operator == '$=':
+        return lambda el: (el.get(name) or '').endswith(value)
+    if operator == '*=':
+        return lambda el: value in (el.get(name) or '')
+    return None
+
+def first_child(el):
+    for sibling in el.itersiblings(preceding=True):
+        if is_element(sibling):
+            return False
+    return True
+
+def last_child(el):
+    for sibling in el.itersiblings():
+        if is_element(sibling):
+            return False
+    return True
+
+def only_child(el):
+    return el.getparent() is not None and first_child(el) and \
+           last_child(el)
+
+def is_root(el):
+    return el.getparent() is None
+
+pseudo_tests = {'first-child': first_child, 'last-child': last_child,
+                'only-child': only_child, 'root': is_root}
+
+def compound_tests(node, key=None):
+    """
+    Returns the list of tests an element must pass to be matched by a
+    compound selector parsed by cssselect, or None if it uses anything
+    not supported here.  If key is a dict, the tag, id and class names
+    the compound requires are stored in it.
+    """
+    # The values tested are bound as default arguments, as the names they
+    # are held in change on each pass of the loop.
+    tests = []
+    while not isinstance(node, Element):
+        if isinstance(node, Hash):
+            id = node.id
+            tests.append(lambda el, id=id: el.get('id') == id)
+            if key is not None:
+                key['id'] = id
+        elif isinstance(node, Class):
+            name = node.class_name
+            tests.append(lambda el, name=name:
+                         el.get('class') is not None and
+                         name in words(el.get('class')))
+            if key is not None:
+                key['class'] = name
+        elif isinstance(node, Attrib):
+            if node.namespace:
+                return None
+            value = node.value.value if node.value is not None else None
+            test = attribute_test(node.attrib, node.operator, value)
+            if test is None:
+                return None
+            tests.append(test)
+        elif isinstance(node, Pseudo):
+            test = pseudo_tests.get(node.ident)
+            if test is None:
+                return None
+            tests.append(test)
+        elif isinstance(node, Negation):
+            negated = compound_tests(node.subselector)
+            if negated is None:
+                return None
+            tests.append(lambda el, negated=negated:
+                         not passes(negated, el))
+        else:
+            return None
+        node = node.selector
+
+    if node.namespace:
+        return None
+    if node.element:
+        tag = node.element
+        tests.append(lambda el: el.tag == tag)
+        if key is not None:
+            key['tag'] = tag
+    tests.reverse()
+    return tests
+
+def passes(tests, el):
+    for test in tests:
+        if not test(el):
+            return False
+    return True
+
+class CompiledSelector:
+    """
+    A selector compiled to tests that are run right to left against an
+    element and its ancestors or previous siblings, as browsers do, for
+    checking many selectors in a single walk of a tree.
+
+    compounds holds the tests of each compound selector, and combinators
+    the combinator to the left of each, both from right to left.  key is
+    a ('id', name), ('class', name) or ('tag', name) pair that any element
+    matched has, or None.
+    """
+
+    def __init__(self, compounds, combinators, key):
+        self.compounds = compounds
+        self.combinators = combinators
+        self.key = key
+
+    def match(self, el, root, i=0):
+        """
+        Returns True if el, an element of the tree under root, is matched
+        by the selector from its ith compound selector leftwards.
+        """
+        if not passes(self.compounds[i], el):
+            return False
+        if i == len(self.combinators):
+            return True
+
+        # What the rest of the selector matches must be under root too.
+        if el is root:
+            return False
+        combinator = self.combinators[i]
+        if combinator == ' ':
+            for ancestor in el.iterancestors():
+                if self.match(ancestor, root, i + 1):
+                    return True
+                if ancestor is root:
+                    break
+        elif combinator == '>':
+            return self.match(el.getparent(), root, i + 1)
+        else:
+            for sibling in el.itersiblings(preceding=True):
+                if not is_element(sibling):
+                    continue
+                if self.match(sibling, root, i + 1):
+                    return True
+                if combinator == '+':
+                    break
+        return False
+
+def compile_selector(selector):
+    """
+    Returns the CompiledSelector for selector text, or None if it can
+    only be checked through XPath.
+    """
+    try:
+        parsed = cssselect.parse(selector)
+    except cssselect.SelectorError:
+        return None
+    if len(parsed) != 1 or parsed[0].pseudo_element:
+        return None
+
+    compounds = []
+    combinators = []
+    key = {}
+    node = parsed[0].parsed_tree
+    while isinstance(node, CombinedSelector):
+        if node.combinator not in ' >+~':
+            return None
+        tests = compound_tests(node.subselector, key if not compounds
+                                                 else None)
+        if tests is None:
+            return None
+        compounds.append(tests)
+        combinators.append(node.combinator)
+        node = node.selector
+    tests = compound_tests(node, key if not compounds else None)
+    if tests is None:
+        return None
+    compounds.append(tests)
+
+    # An id is the rarest thing to require, then a class, then a tag.
+    for name in ('id', 'class', 'tag'):
+        if name in key:
+            return CompiledSelector(compounds, combinators,
+                                    (name, key[name]))
+    return CompiledSelector(compounds, combinators, None)
+
+class Matcher:
+    """
+    Decides whether selectors match documents.
+
+    Selectors whose rightmost compound selector needs an id, class, tag
+    or attribute that the document's ElementIndex doesn't have are ruled
+    out straight away; only the rest are compiled and evaluated.
+
+    Selectors are checked without their dynamic pseudo-classes and
+    pseudo-elements (see static_selector).  A selector that can't be
+    translated to XPath, or whose XPath can't be evaluated, is taken to
+    match, as nothing can be said about it.
+    """
+
+    def __init__(self, cache=None):
+        if cache is None:
+            cache = SelectorCache()
+        self.cache = cache
+        self.targets = {}
+        self.requirements = {}
+        self.compiled = {}
+        self.unsupported = set()
+        self.prefiltered = 0
+        self.evaluated = 0
+        self.walked = 0
+
+    def may_match(self, selector, document):
+        try:
+            requirements = self.requirements[selector]
+        except KeyError:
+            requirements = self.requirements[selector] = \
+                rightmost_requirements(selector)
+
+        if not document.index.may_match(requirements):
+            self.prefiltered += 1
+            return False
+        return True
+
+    def evaluate(self, selector, document):
+        self.evaluated += 1
+        if selector in self.unsupported:
+            return True
+        # cssselect can't translate some selectors, and lxml can't
+        # evaluate some translations, such as those of namespaced ones.
+        try:
+            return self.cache.get(selector)(document.root)
+        except (cssselect.SelectorError, etree.XPathError) as e:
+            logging.warning("Can't check selector '{0}', so it is taken to "
+                            "be used: {1}".format(selector, e))
+            self.unsupported.add(selector)
+            return True
+
+    def target(self, selector):
+        """Returns the selector that is checked for selector."""
+        try:
+            return self.targets[selector]
+        except KeyError:
+            target = self.targets[selector] = static_selector(selector)
+            return target
+
+    def matches(self, selector, document):
+        """Returns True if selector matches an element of the document."""
+        target = self.target(selector)
+        return self.may_match(target, document) and \
+               self.evaluate(target, document)
+
+    def matching(self, selectors, document, timer=None):
+        """
+        Returns the set of selectors that match an element of the
+        document.
+
+        Rather than evaluating each selector over the whole tree, the tree
+        is walked once for all of them (see walk).  If timer is given, it
+        is called with each selector checked and the seconds spent on it:
+        testing elements against it in the walk, or evaluating it as XPath.
+        """
+        targets = {}
+        for selector in set(selectors):
+            targets.setdefault(self.target(selector), []).append(selector)
+        matched = set()
+        for target in self.walk(targets, document, timer):
+            matched.update(targets[target])
+        return matched
+
+    def walk(self, selectors, document, timer=None):
+        """
+        Returns the set of selectors that match an element of the
+        document, walking its tree once.  Each element is only tested
+        against the selectors keyed by its id, class names or tag (or by
+        nothing), right to left, and a selector is taken out of its bucket
+        once it has matched, so it isn't looked at again.  Selectors the
+        walk can't test are evaluated as XPath, as by matches.
+        """
+        matched = set()
+        pending = set()
+        buckets = {}        # key -> {selector: CompiledSelector}
+        for selector in selectors:
+            if not self.may_match(selector, document):
+                continue
+            try:
+                compiled = self.compiled[selector]
+            except KeyError:
+                compiled = self.compiled[selector] = \
+                    compile_selector(selector)
+
+            if compiled is None:
+                start = time.time()
+                if self.evaluate(selector, document):
+                    matched.add(selector)
+                if timer is not None:
+                    timer(selector, time.time() - start)
+                continue
+            pending.add(selector)
+            buckets.setdefault(compiled.key, {})[selector] = compiled
+        self.walked += len(pending)
+
+        spent = {}          # selector -> seconds spent testing elements
+        root = document.root
+        anywhere = buckets.get(None, {})
+        for el in root.iter():
+            if not pending:
+                break
+            if not is_element(el):
+                continue
+            candidates = [anywhere, buckets.get(('tag', el.tag), {})]
+            id = el.get('id')
+            if id is not None:
+                candidates.append(buckets.get(('id', id), {}))
+            names = el.get('class')
+            if names is not None:
+                for name in words(names):
+                    candidates.append(buckets.get(('class', name), {}))
+            for bucket in candidates:
+                for selector, compiled in bucket.items():
+                    if timer is None:
+                        found = compiled.match(el, root)
+                    else:
+                        start = time.time()
+                        found = compiled.match(el, root)
+                        spent[selector] = spent.get(selector, 0.0) + \
+                                          time.time() - start
+                    if found:
+                        del bucket[selector]
+                        pending.remove(selector)
+                        matched.add(selector)
+
+        if timer is not None:
+            for selector, seconds in spent.items():
+                timer(selector, seconds)
+        return matched
+
+    def stats(self):
+        return 'matcher: {0} prefiltered, {1} walked, {2} evaluated; ' \
+               '{3}'.format(self.prefiltered, self.walked, self.evaluated,
+                            self.cache.stats())
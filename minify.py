@@ -0,0 +1,210 @@
+"""
+Minifies CSS in one pass over the tokens of a CSSLexer.
+
+The lexer drops whitespace and comments, so they are left out by simply
+not writing them back.  A single space is put back only where the input
+had whitespace and taking it out could change what the CSS means, ie. the
+descendant combinator in 'a b' or between the values of '1px solid'.
+Characters the lexer doesn't know are copied from the input as they are.
+
+Tokens are collected a segment at a time, up to the next '{', ';' or '}',
+as whether a segment is a selector or a declaration is only known from
+the token ending it.  Within declarations, colors are written in their
+shortest form and, in the properties that only take lengths there,
+lengths of zero lose their unit.
+"""
+from keywords import hex_colors
+from lexer import CSSLexer
+import re
+
+comment = re.compile(CSSLexer.t_ignore_COMMENT)
+hex_color = re.compile(r'#([0-9a-f]{3}|[0-9a-f]{6})$', re.IGNORECASE)
+dimension = re.compile(r'([+-]?(?:[0-9]*\.[0-9]+|[0-9]+))(.*)$')
+vendor = re.compile(r'-[a-z]+-')
+name_char = re.compile(r'[-_a-zA-Z0-9\\\x80-\xff]')
+
+def short_hex(color):
+    """Returns #rrggbb as #rgb if it can be, else as it is."""
+    if len(color) == 7 and color[1] == color[2] and color[3] == color[4] \
+       and color[5] == color[6]:
+        return '#' + color[1] + color[3] + color[5]
+    return color
+
+# The shortest way of writing each color: named colors with a shorter hex
+# form, and hex forms with a shorter name.
+named_hex = {}
+hex_names = {}
+for name, color in sorted(hex_colors.items()):
+    color = short_hex(color)
+    if len(color) < len(name):
+        named_hex[name] = color
+    elif len(name) < len(color) and \
+         len(name) < len(hex_names.get(color, color)):
+        hex_names[color] = name
+
+# Properties whose values hold colors, besides those ending in '-color'.
+# Names are only taken for colors in these, as elsewhere an identifier
+# such as 'red' can be a font or animation name.
+color_properties = frozenset(['color', 'background', 'border', 'border-top',
+                              'border-right', 'border-bottom', 'border-left',
+                              'outline', 'box-shadow', 'text-shadow',
+                              'column-rule', 'text-decoration', 'fill',
+                              'stroke'])
+
+# Units that can be left off a length of zero.  Others, such as those of
+# times and angles, can't.
+length_units = frozenset(['px', 'em', 'rem', 'ex', 'ch', 'vw', 'vh', 'vmin',
+                          'vmax', 'cm', 'mm', 'q', 'in', 'pt', 'pc'])
+
+# Properties where a bare 0 is still read as a length, and the prefixes of
+# families of them.  Elsewhere the unit can matter, as in 'flex: 1 1 0px',
+# where a 0 would be taken for the flex-shrink rather than the basis.
+length_properties = frozenset(['width', 'height', 'top', 'right', 'bottom',
+                               'left', 'gap', 'row-gap', 'column-gap',
+                               'letter-spacing', 'word-spacing',
+                               'text-indent', 'font-size', 'vertical-align',
+                               'box-shadow', 'text-shadow',
+                               'background-position'])
+length_families = ('margin', 'padding', 'border', 'outline', 'inset',
+                   'min-', 'max-')
+
+# The tokens whitespace can be taken out around.
+prelude_tight = frozenset([',', '>', '+', '~', '{', '}', ';'])
+declaration_tight = frozenset([',', ':', '{', '}', ';', '/'])
+
+def shorten_color(value):
+    """Returns the shortest form of a hex color or color name."""
+    lower = value.lower()
+    if lower[0] == '#':
+        if not hex_color.match(lower):
+            return value
+        lower = short_hex(lower)
+        return hex_names.get(lower, lower)
+    return named_hex.get(lower, value)
+
+def shorten_dimension(value):
+    """Returns '0' for a length of zero, else value as it is."""
+    match = dimension.match(value)
+    if match and match.group(2).lower() in length_units and \
+       float(match.group(1)) == 0:
+        return '0'
+    return value
+
+def is_color_property(name):
+    name = vendor.sub('', name.lower(), 1)
+    return name in color_properties or name.endswith('-color')
+
+def is_length_property(name):
+    name = vendor.sub('', name.lower(), 1)
+    return name in length_properties or name.startswith(length_families)
+
+def shorten_values(segment):
+    """
+    Shortens the colors and zero lengths among the values of a
+    declaration segment, given as a list of [type, value, space, commented]
+    items.
+    """
+    colors = is_color_property(segment[0][1])
+    lengths = is_length_property(segment[0][1])
+    depth = 0
+    for item in segment[2:]:
+        type, value = item[0], item[1]
+        if type == 'FUNCTION' or type == '(':
+            depth += 1
+        elif type == ')':
+            depth -= 1
+        elif type == 'DIMENSION' and lengths and depth == 0:
+            item[1] = shorten_dimension(value)
+        elif colors and (type == 'HASH' or
+                         type == 'IDENT' and depth == 0):
+            item[1] = shorten_color(value)
+
+def is_declaration(segment):
+    """Returns True if a segment ended by ';' or '}' is 'property: ...'."""
+    return len(segment) > 1 and segment[0][0] == 'IDENT' and \
+           segment[1][0] == ':'
+
+def write_segment(segment, tight, out):
+    """
+    Writes the items of a segment to out, with a space where the input
+    had whitespace that can't be taken out.
+    """
+    last = None
+    for type, value, space, commented in segment:
+        if last is not None:
+            if space and last not in tight and value not in tight and \
+               not last.endswith('(') and value != ')' and \
+               type != 'IMPORTANT_SYM':
+                out.append(' ')
+            elif commented and name_char.match(last[-1]) and \
+                 name_char.match(value[0]):
+                # Tokens the input only kept apart with a comment.
+                out.append(' ')
+        if type == 'IMPORTANT_SYM':
+            value = '!important'
+        out.append(value)
+        last = value
+
+def minify(data, lexer):
+    """
+    Returns data minified, tokenizing it with lexer, a CSSLexer.  Colors
+    are shortened, lengths of zero lose their unit, and empty declarations
+    and the last ';' of each block are taken out.
+    """
+    out = []
+    segment = []
+    semicolon = False
+    last_end = 0
+    lexer.lexer.input(data)
+    while True:
+        tok = lexer.token()
+        if tok is None:
+            break
+        gap = data[last_end:tok.lexpos]
+        last_end = tok.endlexpos
+        space = commented = False
+        if gap:
+            text = comment.sub('', gap)
+            stray = ' '.join(text.split())
+            if stray:
+                segment.append(['STRAY', stray, text[0].isspace(), False])
+                space = text[-1].isspace()
+            else:
+                space = bool(text)
+                commented = not text
+        segment.append([tok.type, tok.value, space, commented])
+        if tok.type not in ('{', ';', '}'):
+            continue
+
+        # A ';' is only written once a segment other than a lone '}'
+        # follows it, which drops the last one of each block.
+        end = tok.type
+        segment.pop()
+        if end == ';' and not segment:
+            continue
+        if semicolon and (segment or end != '}'):
+            out.append(';')
+        semicolon = False
+        if end == '{':
+            write_segment(segment, prelude_tight, out)
+        elif is_declaration(segment):
+            shorten_values(segment)
+            write_segment(segment, declaration_tight, out)
+        else:
+            write_segment(segment, prelude_tight, out)
+        if end == ';':
+            semicolon = True
+        else:
+            out.append(end)
+        segment = []
+
+    stray = ' '.join(comment.sub('', data[last_end:]).split())
+    if stray:
+        segment.append(['STRAY', stray, False, False])
+    if segment:
+        if semicolon:
+            out.append(';')
+        write_segment(segment, prelude_tight, out)
+    elif semicolon:
+        out.append(';')
+    return ''.join(out)
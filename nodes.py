@@ -0,0 +1,281 @@
+"""
+The nodes CSSParser builds a stylesheet from.
+
+Every node carries the offsets of its source text as start and end, end
+being just past its last character.  Nodes use __slots__, as a large
+stylesheet produces a great many of them.
+"""
+
+def unquote(value):
+    """Strips the quotes from a CSS string, if it has any."""
+    if len(value) > 1 and value[0] in '"\'' and value[-1] == value[0]:
+        return value[1:-1]
+    return value
+
+class Node(object):
+    __slots__ = ('start', 'end')
+
+    def __repr__(self):
+        fields = ', '.join('{0}={1!r}'.format(name, getattr(self, name))
+                           for name in self.__slots__)
+        return '{0}({1})'.format(self.__class__.__name__, fields)
+
+
+########################################################################
+### Statements
+
+class Stylesheet(Node):
+    __slots__ = ('statements',)
+
+    def __init__(self, statements, start=0, end=0):
+        self.statements = statements
+        self.start = start
+        self.end = end
+
+class Charset(Node):
+    __slots__ = ('encoding',)
+
+    def __init__(self, encoding, start=0, end=0):
+        self.encoding = encoding
+        self.start = start
+        self.end = end
+
+class Import(Node):
+    __slots__ = ('url', 'media')
+
+    def __init__(self, url, media, start=0, end=0):
+        self.url = url
+        self.media = media
+        self.start = start
+        self.end = end
+
+class Namespace(Node):
+    __slots__ = ('prefix', 'url')
+
+    def __init__(self, prefix, url, start=0, end=0):
+        self.prefix = prefix
+        self.url = url
+        self.start = start
+        self.end = end
+
+class Page(Node):
+    __slots__ = ('name', 'pseudo', 'declarations')
+
+    def __init__(self, name, pseudo, declarations, start=0, end=0):
+        self.name = name
+        self.pseudo = pseudo
+        self.declarations = declarations
+        self.start = start
+        self.end = end
+
+class FontFace(Node):
+    __slots__ = ('declarations',)
+
+    def __init__(self, declarations, start=0, end=0):
+        self.declarations = declarations
+        self.start = start
+        self.end = end
+
+class Media(Node):
+    """An @media block.  rules holds the statements inside it."""
+    __slots__ = ('queries', 'rules')
+
+    def __init__(self, queries, rules, start=0, end=0):
+        self.queries = queries
+        self.rules = rules
+        self.start = start
+        self.end = end
+
+class Supports(Node):
+    """An @supports block.  rules holds the statements inside it."""
+    __slots__ = ('condition', 'rules')
+
+    def __init__(self, condition, rules, start=0, end=0):
+        self.condition = condition
+        self.rules = rules
+        self.start = start
+        self.end = end
+
+class Keyframes(Node):
+    """
+    An @keyframes block, with or without a vendor prefix.  The keyframes
+    inside it are not kept.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name, start=0, end=0):
+        self.name = name
+        self.start = start
+        self.end = end
+
+class AtRule(Node):
+    """An at-rule CSSParser doesn't know, such as @layer, kept as is."""
+    __slots__ = ('name',)
+
+    def __init__(self, name, start=0, end=0):
+        self.name = name
+        self.start = start
+        self.end = end
+
+class Rule(Node):
+    """A ruleset.  selectors is None for a ruleset with no selectors."""
+    __slots__ = ('selectors', 'declarations')
+
+    def __init__(self, selectors, declarations, start=0, end=0):
+        self.selectors = selectors
+        self.declarations = declarations
+        self.start = start
+        self.end = end
+
+class Declaration(Node):
+    """
+    A property and its values.  Commas separating values are kept in
+    values as ',' items.
+    """
+    __slots__ = ('property', 'values', 'important')
+
+    def __init__(self, property, values, important=False, start=0, end=0):
+        self.property = property
+        self.values = values
+        self.important = important
+        self.start = start
+        self.end = end
+
+    @property
+    def value(self):
+        return ' '.join(self.values).replace(' , ', ', ')
+
+
+########################################################################
+### Selectors
+
+class SelectorGroup(Node):
+    __slots__ = ('selectors',)
+
+    def __init__(self, selectors, start=0, end=0):
+        self.selectors = selectors
+        self.start = start
+        self.end = end
+
+class Selector(Node):
+    """
+    A chain of compound selectors, combinators[i] joining compounds[i]
+    and compounds[i + 1].  text is the selector as css3tool reports it.
+    """
+    __slots__ = ('compounds', 'combinators', 'text')
+
+    def __init__(self, compounds, combinators, start=0, end=0):
+        self.compounds = compounds
+        self.combinators = combinators
+        self.text = None
+        self.start = start
+        self.end = end
+
+    def format(self):
+        parts = [self.compounds[0].text]
+        for combinator, compound in zip(self.combinators, self.compounds[1:]):
+            if combinator.value != ' ':
+                parts.append(combinator.value)
+            parts.append(compound.text)
+        return ' '.join(parts)
+
+class Combinator(Node):
+    """One of ' ' (descendant), '>', '+' or '~'."""
+    __slots__ = ('value',)
+
+    def __init__(self, value, start=0, end=0):
+        self.value = value
+        self.start = start
+        self.end = end
+
+class Compound(Node):
+    """
+    A simple selector sequence such as 'ns|a.b#c[d]:hover'.  element is
+    a tag name, '*' or None, and namespace is None unless a namespace
+    prefix was given.  ids and classes hold bare names.
+    """
+    __slots__ = ('element', 'namespace', 'ids', 'classes', 'attributes',
+                 'pseudos', 'negations', 'text')
+
+    def __init__(self, element=None, namespace=None, start=0, end=0):
+        self.element = element
+        self.namespace = namespace
+        self.ids = []
+        self.classes = []
+        self.attributes = []
+        self.pseudos = []
+        self.negations = []
+        if element is None:
+            self.text = ''
+        elif namespace is None:
+            self.text = element
+        else:
+            self.text = namespace + '|' + element
+        self.start = start
+        self.end = end
+
+    def add(self, part):
+        """
+        Adds a part of a simple selector sequence: an id ('#id'), a class
+        ('.class'), an Attribute, a Pseudo or a Negation.
+        """
+        if isinstance(part, basestring):
+            if part[0] == '#':
+                self.ids.append(part[1:])
+            else:
+                self.classes.append(part[1:])
+            self.text += part
+            return
+        elif isinstance(part, Attribute):
+            self.attributes.append(part)
+        elif isinstance(part, Pseudo):
+            self.pseudos.append(part)
+        else:
+            self.negations.append(part)
+        self.text += part.text
+
+class Attribute(Node):
+    """An attribute selector.  op and value are None for [name]."""
+    __slots__ = ('namespace', 'name', 'op', 'value', 'text')
+
+    def __init__(self, namespace, name, op, value, start=0, end=0):
+        self.namespace = namespace
+        self.name = name
+        self.op = op
+        self.value = value and unquote(value)
+        text = name
+        if namespace is not None:
+            text = namespace + '|' + name
+        if op is not None:
+            text += op + value
+        self.text = '[' + text + ']'
+        self.start = start
+        self.end = end
+
+class Pseudo(Node):
+    """
+    A pseudo-class, or a pseudo-element if element is True.  argument
+    is the text between the parentheses of a functional pseudo-class.
+    """
+    __slots__ = ('name', 'argument', 'element', 'text')
+
+    def __init__(self, name, argument=None, element=False, start=0, end=0):
+        self.name = name
+        self.argument = argument
+        self.element = element
+        text = name
+        if argument is not None:
+            text += '(' + argument + ')'
+        self.text = (element and '::' or ':') + text
+        self.start = start
+        self.end = end
+
+class Negation(Node):
+    """:not() around a Compound holding a single simple selector."""
+    __slots__ = ('argument', 'text')
+
+    def __init__(self, argument, text, start=0, end=0):
+        self.argument = argument
+        self.text = text
+        self.start = start
+        self.end = end
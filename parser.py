@@ -1,6 +1,18 @@
 import ply.yacc as yacc
+from ply.lex import LexToken
 from lexer import CSSLexer
+from tokenizer import Tokenizer
+from nodes import (Stylesheet, Charset, Import, Namespace, Page, FontFace,
+                   Media, Supports, Keyframes, AtRule, Rule, Declaration,
+                   SelectorGroup, Selector, Combinator, Compound, Attribute,
+                   Pseudo, Negation, unquote)
+from stream import iter_statements
+import hashlib
 import logging
+import os
+import re
+
+comment = re.compile(CSSLexer.t_ignore_COMMENT)
 
 class CSSParser:
 
@@ -8,35 +20,217 @@ class CSSParser:
     ### Grammar
 
 
-    def __init__(self, debug=False):
+    def __init__(self, debug=False, tabledir=None, fast=False):
+        """
+        Building the LALR tables from the grammar below is by far the most
+        expensive part of parsing a small stylesheet, so a parser should be
+        built once and reused for every input.  If tabledir is given, the
+        generated tables are pickled there and loaded on the next build,
+        keyed by a hash of the grammar so stale tables are never used.
+
+        With fast, input is tokenized by a tokenizer.Tokenizer rather than
+        the ply lexer, giving the same tokens.
+        """
         self.debug = debug
+        self.tabledir = tabledir
+        self.fast = fast
         self.lexer = CSSLexer(debug=self.debug)
+        if fast:
+            self.lexer.lexer = Tokenizer()
         self.tokens = self.lexer.tokens
-        self.parser = yacc.yacc(module=self, debug=debug, write_tables=0)
-        self.selectors = []
 
-    def parse(self, data):
-        if data:
-            if self.debug:
-                self.lexer.debug(data)
-            return self.parser.parse(data, self.lexer.lexer)
+        picklefile = None
+        if tabledir:
+            if not os.path.isdir(tabledir):
+                os.makedirs(tabledir)
+            picklefile = os.path.join(tabledir, 'parsetab-{0}.pickle'.format(
+                                      self.grammar_hash()))
+
+        self.parser = yacc.yacc(module=self, debug=debug, write_tables=0,
+                                picklefile=picklefile)
+        self.selectors = []
+        self.offsets = []
+        self.skipped = []
+
+        # The grammar actions below do no logging of their own, so nothing
+        # is formatted on each reduction unless tracing is switched on here.
+        if debug:
+            self.trace_actions()
+            self.tokenfunc = self.lexer.trace()
         else:
-            return []
+            self.tokenfunc = self.lexer.token
+
+    @classmethod
+    def grammar_hash(cls):
+        """Returns a digest of the tokens and grammar rule docstrings."""
+        digest = hashlib.sha1()
+        digest.update(' '.join(CSSLexer.tokens + CSSLexer.literals))
+        for name in sorted(dir(cls)):
+            if name.startswith('p_'):
+                digest.update(name)
+                digest.update(getattr(cls, name).__doc__ or '')
+        return digest.hexdigest()
+
+    def trace_actions(self):
+        """
+        Wraps the action of every grammar rule so that each reduction is
+        logged along with its result.
+        """
+        for production in self.parser.productions:
+            if production.callable is None:
+                continue
+            label = production.name.replace('_', ' ').replace('-', ' ')
+            production.callable = self.traced(production.callable,
+                                              label.upper())
+
+    @staticmethod
+    def traced(action, label):
+        def traced_action(p):
+            action(p)
+            logging.debug('FOUND {0}: {1}'.format(label, p[0]))
+        return traced_action
+
+    def reset(self):
+        """Clears the state collected by the previous parse."""
+        self.selectors = []
+        self.offsets = []
+        self.skipped = []
+
+    def source(self, start, end):
+        """Returns the input between two offsets of the current parse."""
+        offset = self.lexer.offset
+        return self.lexer.lexer.lexdata[start - offset:end - offset]
+
+    def skip(self, p):
+        """
+        Records the input skipped by the error rule being reduced in
+        self.skipped, as a (start, end) pair of offsets.
+        """
+        start, end = p.lexspan(0)
+        self.skipped.append((start, end))
+        logging.debug('Skipped unparseable input at {0}: {1!r}'.format(
+                      start, self.source(start, end)))
+
+    def parse(self, data, offset=0):
+        """
+        Parses a stylesheet and returns it as a Stylesheet node.  The text
+        of every selector found is also collected in self.selectors, and
+        the offset of its rule in self.offsets.
+
+        Input the grammar doesn't allow is skipped the way browsers skip
+        it: a bad declaration up to the next ';' or the end of its block,
+        and any other bad statement up to the next ';' or the end of its
+        block, including the block.  Whatever is still open at the end of
+        the input is closed, and a bad statement that can't be closed is
+        skipped to the end of the input.  Each skipped part is recorded in
+        self.skipped.
+
+        If data starts part way through a file, offset is where it starts,
+        so the nodes get offsets into the whole file.
+        """
+        self.reset()
+        return self.parse_more(data, offset)
+
+    def parse_more(self, data, offset=0):
+        """Like parse, but adds to the state of the previous parse."""
+        if not data:
+            return Stylesheet([], offset, offset)
+
+        # Tracking gives every grammar symbol the offsets of its source
+        # text, from which the nodes get their start and end.
+        self.lexer.offset = offset
+        try:
+            stylesheet = self.parser.parse(data, self.lexer.lexer,
+                                           tracking=True,
+                                           tokenfunc=self.tokenfunc)
+        finally:
+            self.lexer.offset = 0
+        if stylesheet is None:
+            stylesheet = self.recover(offset, offset + len(data))
+        return stylesheet
+
+    def recover(self, start, end):
+        """
+        Returns the statements parsed before ply gave up at the end of the
+        input, which it does when it is still skipping a bad statement
+        there, as in 'a {} ]'.  The rest of the input, from the first
+        symbol on the stack after those statements, is recorded as
+        skipped.
+        """
+        statements = []
+        symbols = [s for s in self.parser.symstack if s.type != '$end']
+        if symbols and symbols[0].type == 'statements':
+            statements = symbols.pop(0).value
+        if symbols:
+            skipped = getattr(symbols[0], 'lexpos', end)
+            self.skipped.append((skipped, end))
+            logging.debug('Skipped unparseable input at {0}: {1!r}'.format(
+                          skipped, self.source(skipped, end)))
+        return Stylesheet(statements, start, end)
+
+    def iterparse(self, fh, chunk_size=65536):
+        """
+        Parses a stylesheet read from the file object fh in chunks and
+        yields its top-level statements as they are parsed, so memory use
+        is bounded by the largest statement rather than the whole file.
+        self.selectors collects the selectors of the whole file, and holds
+        those of each statement by the time it is yielded.
+
+        Statements are parsed in batches of about chunk_size characters,
+        to keep the per-parse overhead low for files of many small rules.
+        """
+        self.reset()
+        batch = []
+        batch_offset = 0
+        size = 0
+        for offset, text in iter_statements(fh, chunk_size):
+            if not batch:
+                batch_offset = offset
+            batch.append(text)
+            size += len(text)
+            if size >= chunk_size:
+                for statement in self.parse_batch(batch, batch_offset):
+                    yield statement
+                batch = []
+                size = 0
+        if batch:
+            for statement in self.parse_batch(batch, batch_offset):
+                yield statement
+
+    def parse_batch(self, batch, offset):
+        return self.parse_more(''.join(batch), offset).statements
+
+    # The lists built by the right-recursive rules below are appended to
+    # as they are reduced, so they come out in reverse order.  The rule
+    # that uses such a list reverses it once, which avoids rebuilding the
+    # list on every reduction.
 
     def p_stylesheet(self, p):
         """stylesheet : CDO
                       | CDC
                       | statements
+                      |
         """
-        p[0] = p[1]
-        logging.debug('FOUND STYLESHEET: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        if len(p) == 2 and p.slice[1].type == 'statements':
+            p[0] = Stylesheet(p[1], start, end)
+        else:
+            p[0] = Stylesheet([], start, end)
 
+    # Statements are left-recursive, unlike the other lists: each one is
+    # reduced into the list as soon as it is parsed, so error recovery
+    # never has to pop, and lose, the statements before an error.
     def p_statements(self, p):
-        """statements : statement statements
+        """statements : statements statement
                       | statement
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND STATEMENTS: {0}'.format(p[0]))
+        if len(p) == 3:
+            p[0] = p[1]
+        else:
+            p[0] = []
+        # Statements skipped by error recovery are None.
+        if p[len(p) - 1] is not None:
+            p[0].append(p[len(p) - 1])
 
     def p_statement(self, p):
         """statement : ruleset
@@ -45,9 +239,29 @@ class CSSParser:
                      | page
                      | font-face
                      | media
+                     | supports
+                     | keyframes
+                     | charset
+                     | at_rule
         """
         p[0] = p[1]
-        logging.debug('FOUND STATEMENT: {0}'.format(p[0]))
+
+    def p_statement_error(self, p):
+        """statement : error ';'
+                     | error block
+                     | error '}'
+        """
+        self.skip(p)
+        p[0] = None
+
+
+    ##########################################################
+    ### Charset
+
+    def p_charset(self, p):
+        """charset : CHARSET_SYM STRING ';'"""
+        start, end = p.lexspan(0)
+        p[0] = Charset(unquote(p[2]), start, end)
 
 
     ##########################################################
@@ -59,15 +273,25 @@ class CSSParser:
                   | IMPORT_SYM URI import_term ';'
                   | IMPORT_SYM URI ';'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND IMPORT: {0}'.format(p[0]))
+        url = p[2]
+        if p.slice[2].type == 'URI':
+            url = url[4:-1].strip()
+        media = []
+        if len(p) == 5:
+            media = p[3]
+            media.reverse()
+        start, end = p.lexspan(0)
+        p[0] = Import(unquote(url), media, start, end)
 
     def p_import_term(self, p):
         """import_term : IDENT ',' import_term
                        | IDENT
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND IMPORT TERM: {0}'.format(p[0]))
+        if len(p) == 4:
+            p[0] = p[3]
+            p[0].append(p[1])
+        else:
+            p[0] = [p[1]]
 
 
     ##########################################################
@@ -79,8 +303,11 @@ class CSSParser:
                      | NAMESPACE_SYM STRING ';'
                      | NAMESPACE_SYM URI ';'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND NAMESPACE: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        if len(p) == 5:
+            p[0] = Namespace(p[2], p[3], start, end)
+        else:
+            p[0] = Namespace(None, p[2], start, end)
 
 
     ##########################################################
@@ -90,13 +317,16 @@ class CSSParser:
         """page : PAGE_SYM IDENT pseudo_page '{' declarations '}'
                 | PAGE_SYM pseudo_page '{' declarations '}'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND PAGE: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        p[len(p) - 2].reverse()
+        if len(p) == 7:
+            p[0] = Page(p[2], p[3], p[5], start, end)
+        else:
+            p[0] = Page(None, p[2], p[4], start, end)
 
     def p_pseudo_page(self, p):
         """pseudo_page : ':' IDENT"""
         p[0] = p[1] + p[2]
-        logging.debug('FOUND PSEUDO PAGE: {0}'.format(p[0]))
 
 
     ##########################################################
@@ -104,65 +334,141 @@ class CSSParser:
 
     def p_font_face(self, p):
         """font-face : FONT_FACE_SYM '{' declarations '}'"""
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND FONT FACE: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        p[3].reverse()
+        p[0] = FontFace(p[3], start, end)
 
     
     ##########################################################
     ### At Rule: media query
 
     def p_media(self, p):
-        """media : MEDIA_SYM media_query_list '{' ruleset '}'
+        """media : MEDIA_SYM media_query_list '{' statements '}'
                  | MEDIA_SYM media_query_list '{' '}'
                  | MEDIA_SYM '{' '}'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND MEDIA LIST: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        queries = []
+        rules = []
+        if len(p) > 4:
+            queries = p[2]
+            queries.reverse()
+        if len(p) == 6:
+            rules = p[4]
+        p[0] = Media(queries, rules, start, end)
 
     def p_media_query_list(self, p):
         """media_query_list : media_query ',' media_query_list
                             | media_query
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND MEDIA LIST: {0}'.format(p[0]))
+        if len(p) == 4:
+            p[0] = p[3]
+            p[0].append(p[1])
+        else:
+            p[0] = [p[1]]
 
     def p_media_query(self, p):
         """media_query : ONLY media_expressions
                        | NOT media_expressions
                        | media_expressions
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND MEDIA QUERY: {0}'.format(p[0]))
+        p[0] = ' '.join(p[1:])
 
     def p_media_expressions(self, p):
         """media_expressions : media_expression AND media_expressions
                              | media_expression
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND MEDIA EXPRESSIONS: {0}'.format(p[0]))
+        p[0] = ' '.join(p[1:])
    
     def p_media_expression(self, p):
         """media_expression : '(' IDENT ':' expr ')'
                             | '(' IDENT ')'
                             | IDENT
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND MEDIA EXPRESSION: {0}'.format(p[0]))
+        if len(p) == 6:
+            p[0] = '({0}: {1})'.format(p[2], p[4])
+        else:
+            p[0] = ''.join(p[1:])
 
     def p_expr(self, p):
         """expr : helper expr
                 | helper
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND EXPR: {0}'.format(p[0]))
+        if len(p) == 3 and not p[2].startswith((',', '/')):
+            p[0] = p[1] + ' ' + p[2]
+        else:
+            p[0] = ''.join(p[1:])
+
+    ##########################################################
+    ### At Rule: supports, keyframes, and others
+
+    def p_supports(self, p):
+        """supports : SUPPORTS_SYM prelude '{' statements '}'
+                    | SUPPORTS_SYM prelude '{' '}'
+        """
+        start, end = p.lexspan(0)
+        rules = []
+        if len(p) == 6:
+            rules = p[4]
+        condition = self.source(*p.lexspan(2)).strip()
+        p[0] = Supports(condition, rules, start, end)
+
+    def p_keyframes(self, p):
+        """keyframes : KEYFRAMES_SYM IDENT block
+                     | KEYFRAMES_SYM STRING block
+        """
+        start, end = p.lexspan(0)
+        p[0] = Keyframes(unquote(p[2]), start, end)
+
+    def p_at_rule(self, p):
+        """at_rule : ATKEYWORD prelude ';'
+                   | ATKEYWORD prelude block
+                   | ATKEYWORD ';'
+                   | ATKEYWORD block
+        """
+        start, end = p.lexspan(0)
+        p[0] = AtRule(p[1][1:], start, end)
+
+    # The rules below only check that braces are balanced; nothing is
+    # built from what they match.
+
+    def p_block(self, p):
+        """block : '{' block_items '}'
+                 | '{' '}'
+        """
+
+    def p_block_items(self, p):
+        """block_items : block_item block_items
+                       | block_item
+        """
+
+    def p_block_item(self, p):
+        """block_item : prelude_token
+                      | ';'
+                      | block
+        """
+
+    def p_prelude(self, p):
+        """prelude : prelude_token prelude
+                   | prelude_token
+        """
+
+    def p_prelude_token(self, p):
+        pass
+    p_prelude_token.__doc__ = 'prelude_token : ' + '\n| '.join(
+        CSSLexer.tokens + ["'{0}'".format(c) for c in sorted(set(
+        CSSLexer.literals)) if c not in '{};'])
+
+
+    ##########################################################
+    ### Expressions
 
     def p_helper(self, p):
         """helper : ',' term
-                  | '\' term
+                  | '/' term
                   | term
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND HELPER: {0}'.format(p[0]))
+        p[0] = ''.join(p[1:])
 
 
     def p_unary_operator(self, p):
@@ -170,8 +476,10 @@ class CSSParser:
                           | '-'
                           |
         """
-        p[0] = p[1]
-        logging.debug('FOUND UNARY OPERATOR: {0}'.format(p[0]))
+        if len(p) == 2:
+            p[0] = p[1]
+        else:
+            p[0] = ''
 
     def p_term(self, p):
         """term : unary_operator NUMBER
@@ -182,13 +490,11 @@ class CSSParser:
                 | URI
                 | function
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND TERM: {0}'.format(p[0]))
+        p[0] = ''.join(p[1:])
 
     def p_function(self, p):
         """function : FUNCTION expr ')'"""
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND TERM: {0}'.format(p[0]))
+        p[0] = ''.join(p[1:])
 
 
     ##########################################################
@@ -200,49 +506,84 @@ class CSSParser:
                    | '{' declarations '}'
                    | '{' '}'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND RULESET: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        selectors = None
+        if p.slice[1].type == 'selector_group':
+            # Selectors are only collected once their whole rule has been
+            # parsed, so a rule dropped by error recovery leaves none.
+            selectors = p[1]
+            for selector in selectors.selectors:
+                self.selectors.append(selector.text)
+                self.offsets.append(start)
+            selectors.selectors.reverse()
+        declarations = []
+        if p.slice[len(p) - 2].type == 'declarations':
+            declarations = p[len(p) - 2]
+            declarations.reverse()
+        p[0] = Rule(selectors, declarations, start, end)
 
     def p_declarations(self, p):
         """declarations : declaration ';' declarations
                         | declaration ';'
                         | declaration
+                        | ';' declarations
+                        | ';'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND DECLARATIONS: {0}'.format(p[0]))
+        if p.slice[len(p) - 1].type == 'declarations':
+            p[0] = p[len(p) - 1]
+        else:
+            p[0] = []
+        # Declarations skipped by error recovery are None.
+        if p.slice[1].type == 'declaration' and p[1] is not None:
+            p[0].append(p[1])
 
     def p_declaration(self, p):
-        """declaration : property ':' values"""
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND DECLARATION: {0}'.format(p[0]))
+        """declaration : property ':' values IMPORTANT_SYM
+                       | property ':' values
+        """
+        start, end = p.lexspan(0)
+        p[3].reverse()
+        p[0] = Declaration(p[1], p[3], len(p) == 5, start, end)
+
+    def p_declaration_error(self, p):
+        """declaration : error"""
+        self.skip(p)
+        p[0] = None
 
     def p_property(self, p):
         """property : IDENT"""
         p[0] = p[1]
-        logging.debug('FOUND PROPERTY: {0}'.format(p[0]))
 
     def p_values(self, p):
         """values : value ',' values
                   | value values
                   | value
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND VALUES: {0}'.format(p[0]))
+        if len(p) == 4:
+            p[0] = p[3]
+            p[0].append(',')
+            p[0].append(p[1])
+        elif len(p) == 3:
+            p[0] = p[2]
+            p[0].append(p[1])
+        else:
+            p[0] = [p[1]]
 
     def p_value(self, p):
         """value : any"""
         #        | block
         #        | ATKEYWORD
         p[0] = p[1]
-        logging.debug('FOUND VALUE: {0}'.format(p[0]))
 
     def p_anys(self, p):
         """anys : any ',' anys
                 | any anys
                 | any
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND VALUES: {0}'.format(p[0]))
+        if len(p) == 3:
+            p[0] = p[1] + ' ' + p[2]
+        else:
+            p[0] = ''.join(p[1:])
 
     def p_any(self, p):
         """any : DIMENSION
@@ -260,10 +601,10 @@ class CSSParser:
                | '(' ')'
                | '[' anys ']'
                | '[' ']'
+               | '/'
         """
         # UNICODE-RANGE, DELIM
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND ANY: {0}'.format(p[0]))
+        p[0] = ''.join(p[1:])
 
 
 
@@ -277,17 +618,36 @@ class CSSParser:
                           | selector
         """
         #                 | selector selector_group
-        self.selectors.append(p[1])
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND SELECTOR GROUP: {0}'.format(p[0]))
+        p[1].text = p[1].format()
+        start, end = p.lexspan(0)
+        if len(p) == 4:
+            p[0] = p[3]
+            p[0].selectors.append(p[1])
+            p[0].start = start
+        else:
+            p[0] = SelectorGroup([p[1]], start, end)
 
     def p_selector(self, p):
         """selector : simple_selector_sequence
                     | simple_selector_sequence combinator selector
                     | simple_selector_sequence selector
         """
-        p[0] = reduce(lambda x, y: x+' '+y, p[1:])
-        logging.debug('FOUND SELECTOR: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        compounds = p[1]
+        combinators = [Combinator(' ', left.end, right.start)
+                       for left, right in zip(compounds, compounds[1:])]
+        if len(p) == 2:
+            p[0] = Selector(compounds, combinators, start, end)
+            return
+
+        p[0] = p[len(p) - 1]
+        if len(p) == 4:
+            combinator = p[2]
+        else:
+            combinator = Combinator(' ', compounds[-1].end, p[2].start)
+        p[0].compounds[0:0] = compounds
+        p[0].combinators[0:0] = combinators + [combinator]
+        p[0].start = start
 
     def p_combinator(self, p):
         """combinator : '+'
@@ -295,8 +655,8 @@ class CSSParser:
                       | '~'
         """
         # | S
-        p[0] = p[1]
-        logging.debug('FOUND COMBINATOR: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        p[0] = Combinator(p[1], start, end)
 
     def p_simple_selector_sequence(self, p):
         """simple_selector_sequence : type_selector sss_types
@@ -305,15 +665,45 @@ class CSSParser:
                                     | universal_selector
                                     | sss_types
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND SIMPLE SELECTOR SEQUENCE: {0}'.format(p[0]))
+        # The lexer drops whitespace, so '.a .b' reaches this rule as one
+        # sequence of parts.  Parts with whitespace between them belong to
+        # compounds joined by a descendant combinator, so a list of
+        # compounds is returned.
+        start, end = p.lexspan(0)
+        if p.slice[1].type == 'sss_types':
+            compound = Compound(None, None, start, start)
+            parts = p[1]
+        else:
+            compound = p[1]
+            parts = p[2:] and p[2] or []
+        compounds = [compound]
+        for part, part_start, part_end in reversed(parts):
+            if compound.end < part_start and \
+               self.is_whitespace(compound.end, part_start):
+                compound = Compound(None, None, part_start, part_end)
+                compounds.append(compound)
+            compound.add(part)
+            compound.end = part_end
+        p[0] = compounds
+
+    def is_whitespace(self, start, end):
+        """
+        Returns True if the input between two tokens has whitespace outside
+        comments.  Only whitespace and comments can come between tokens.
+        """
+        return bool(comment.sub('', self.source(start, end)))
 
     def p_sss_types(self, p):
         """sss_types : sss_type sss_types
                      | sss_type
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND SIMPLE SELECTOR SEQUENCE TYPES: {0}'.format(p[0]))
+        # Each part is kept with its offsets, see simple_selector_sequence.
+        part = (p[1],) + p.lexspan(1)
+        if len(p) == 3:
+            p[0] = p[2]
+            p[0].append(part)
+        else:
+            p[0] = [part]
 
     def p_sss_type(self, p):
         """sss_type : HASH
@@ -323,21 +713,26 @@ class CSSParser:
                     | negation
         """
         p[0] = p[1]
-        logging.debug('FOUND SIMPLE SELECTOR SEQUENCE TYPE: {0}'.format(p[0]))
 
     def p_type_selector(self, p):
         """type_selector : namespace_prefix element_name
                          | element_name
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND TYPE SELECTOR: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        if len(p) == 3:
+            p[0] = Compound(p[2], p[1], start, end)
+        else:
+            p[0] = Compound(p[1], None, start, end)
 
     def p_universal_selector(self, p):
         """universal_selector : namespace_prefix '*'
                               | '*'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND UNIVERSAL SELECTOR: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        if len(p) == 3:
+            p[0] = Compound('*', p[1], start, end)
+        else:
+            p[0] = Compound('*', None, start, end)
         
 
     def p_namespace_prefix(self, p):
@@ -345,18 +740,18 @@ class CSSParser:
                             | '*' '|'
                             | '|'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND NAMESPACE PREFIX: {0}'.format(p[0]))
+        if len(p) == 3:
+            p[0] = p[1]
+        else:
+            p[0] = ''
 
     def p_element_name(self, p):
         """element_name : IDENT"""
         p[0] = p[1]
-        logging.debug('FOUND ELEMENT NAME: {0}'.format(p[0]))
 
     def p_class(self, p):
         """class : '.' IDENT"""
         p[0] = p[1] + p[2]
-        logging.debug('FOUND CLASS: {0}'.format(p[0]))
 
 
     #######################################################
@@ -368,36 +763,40 @@ class CSSParser:
                   | ':' IDENT
                   | ':' functional_pseudo
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND PSEUDO: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        element = len(p) == 4
+        last = p[len(p) - 1]
+        if isinstance(last, Pseudo):
+            p[0] = Pseudo(last.name, last.argument, element, start, end)
+        else:
+            p[0] = Pseudo(last, None, element, start, end)
 
     def p_functional_pseudo(self, p):
         """functional_pseudo : FUNCTION expressions ')'"""
-        p[0] = p[1] + p[2] + p[3]
-        logging.debug('FOUND PSEUDO FUNCTION: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        p[0] = Pseudo(p[1][:-1], p[2], False, start, end)
 
     def p_expressions(self, p):
         """expressions : expression expressions
                        | expression
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND EXPRESSIONS: {0}'.format(p[0]))
+        p[0] = ''.join(p[1:])
 
     def p_expression(self, p):
         """expression : '+'
                       | '-'
                       | NUMBER
+                      | DIMENSION
                       | STRING
                       | IDENT
         """
-        #             | DIMENSION
         p[0] = p[1]
-        logging.debug('FOUND EXPRESSION {0}'.format(p[0]))
 
     def p_negation(self, p):
         """negation : ':' NOTFUNC negation_arg ')'"""
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND NEGATION: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        text = p[1] + p[2] + p[3].text + p[4]
+        p[0] = Negation(p[3], text, start, end)
 
     def p_negation_arg(self, p):
         """negation_arg : type_selector
@@ -407,8 +806,12 @@ class CSSParser:
                         | attrib
                         | pseudo
         """
-        p[0] = p[1]
-        logging.debug('FOUND NEGATION ARG: {0}'.format(p[0]))
+        if isinstance(p[1], Compound):
+            p[0] = p[1]
+        else:
+            start, end = p.lexspan(0)
+            p[0] = Compound(None, None, start, end)
+            p[0].add(p[1])
 
 
     ######################################################
@@ -420,15 +823,23 @@ class CSSParser:
                   | '[' IDENT attrib_value ']'
                   | '[' IDENT ']'
         """
-        p[0] = reduce(lambda x, y: x+y, p[1:])
-        logging.debug('FOUND ATTRIBUTE: {0}'.format(p[0]))
+        start, end = p.lexspan(0)
+        namespace = None
+        if p.slice[2].type == 'namespace_prefix':
+            namespace = p[2]
+            name = p[3]
+        else:
+            name = p[2]
+        op = value = None
+        if p.slice[len(p) - 2].type == 'attrib_value':
+            op, value = p[len(p) - 2]
+        p[0] = Attribute(namespace, name, op, value, start, end)
 
     def p_attrib_value(self, p):
         """attrib_value : attrib_selector_op IDENT
                         | attrib_selector_op STRING
         """
-        p[0] = p[1] + p[2]
-        logging.debug('FOUND ATTRIBUTE VALUE: {0}'.format(p[0]))
+        p[0] = (p[1], p[2])
 
     def p_attrib_selector_op(self, p):
         """attrib_selector_op : PREFIXMATCH
@@ -439,7 +850,28 @@ class CSSParser:
                               | DASHMATCH
         """
         p[0] = p[1]
-        logging.debug('FOUND SELECTOR OP: {0}'.format(p[0]))
 
     def p_error(self, p):
-        logging.debug("Syntax error at '{0}'".format(p))
+        if p is not None:
+            logging.debug("Syntax error at '{0}'".format(p))
+            # Before the first statement, ply drops a bad token by itself,
+            # without the error rules or skip, so '] a {}' would keep
+            # 'a {}' and the ']' go unrecorded.  A second entry for the
+            # start state under the stack makes it recover as it does
+            # after a statement.
+            statestack = self.parser.statestack
+            if len(statestack) == 1:
+                statestack.insert(0, statestack[0])
+                self.parser.symstack.insert(0, self.parser.symstack[0])
+            return
+
+        # At the end of the input, close the innermost open block and
+        # carry on.  Anything that can't be closed is skipped as usual.
+        logging.debug('Unexpected end of input')
+        tok = LexToken()
+        tok.type = tok.value = '}'
+        tok.lineno = self.lexer.lexer.lineno
+        tok.lexpos = tok.endlexpos = self.lexer.offset + \
+                                     self.lexer.lexer.lexlen
+        self.parser.errok()
+        return tok
@@ -0,0 +1,118 @@
+"""
+Writes copies of stylesheets with their unused selectors taken out.
+
+Only the unused parts are cut from the source text, by the offsets of
+the nodes CSSParser builds; everything else, comments, formatting and the
+input the parser skipped included, is copied as it is.
+"""
+from minify import minify
+import os
+import re
+
+# The blanks ending the line of a statement, taken out with it.
+trailing = re.compile(r'[ \t]*(\r?\n)?')
+
+def common_dir(paths):
+    """Returns the deepest directory holding every one of paths."""
+    parts = [os.path.dirname(os.path.abspath(path)).split(os.sep)
+             for path in paths]
+    common = parts[0]
+    for other in parts[1:]:
+        i = 0
+        while i < min(len(common), len(other)) and common[i] == other[i]:
+            i += 1
+        common = common[:i]
+    return os.sep.join(common) or os.sep
+
+def cut_statement(data, statement, cuts):
+    """
+    Adds a cut of statement and the blanks before it.  A statement that
+    starts its line takes the rest of the line with it, if that is blank.
+    """
+    start = statement.start
+    while start > 0 and data[start - 1] in ' \t':
+        start -= 1
+    end = statement.end
+    if start == 0 or data[start - 1] == '\n':
+        end = trailing.match(data, end).end()
+    cuts.append((start, end, ''))
+
+def prune_statements(data, statements, unused, cuts):
+    """
+    Adds to cuts the (start, end, replacement) edits that take the
+    selectors in unused out of statements, and returns True if nothing
+    would be left of them.  A ruleset is dropped once it has no selectors
+    left, and an @media or @supports block once it has no rules left.
+    """
+    left = False
+    for statement in statements:
+        rules = getattr(statement, 'rules', None)
+        if rules and prune_statements(data, rules, unused, cuts):
+            # The cuts made inside the block are covered by this one.
+            while cuts and cuts[-1][0] >= statement.start:
+                cuts.pop()
+            cut_statement(data, statement, cuts)
+            continue
+
+        group = getattr(statement, 'selectors', None)
+        if group is None:
+            left = True
+            continue
+        selectors = group.selectors
+        kept = [i for i, selector in enumerate(selectors)
+                if selector.text not in unused]
+        if not kept:
+            cut_statement(data, statement, cuts)
+            continue
+        left = True
+        if len(kept) == len(selectors):
+            continue
+
+        # The kept selectors are joined by the separators that came
+        # before them, so 'a, b,\nc' less b gives 'a,\nc'.
+        first = selectors[kept[0]]
+        text = [data[first.start:first.end]]
+        for i in kept[1:]:
+            text.append(data[selectors[i - 1].end:selectors[i].end])
+        cuts.append((group.start, group.end, ''.join(text)))
+    return not left
+
+def prune(data, stylesheet, unused):
+    """
+    Returns data, the text stylesheet was parsed from, without the
+    selectors in unused and the rules and blocks left empty by taking
+    them out.
+    """
+    cuts = []
+    prune_statements(data, stylesheet.statements, unused, cuts)
+    return apply_cuts(data, cuts)
+
+def apply_cuts(data, cuts):
+    """Returns data with cuts, in order, replaced by their replacements."""
+    parts = []
+    last = 0
+    for start, end, text in cuts:
+        parts.append(data[last:start])
+        parts.append(text)
+        last = end
+    parts.append(data[last:])
+    return ''.join(parts)
+
+def prune_file(data, stylesheet, target, unused, lexer=None):
+    """
+    Writes the pruned copy of data, the text stylesheet was parsed from, to
+    target, minified with lexer if one is given, and returns the sizes of
+    the text before and after, in bytes.
+    """
+    pruned = prune(data, stylesheet, unused)
+    if lexer is not None:
+        pruned = minify(pruned, lexer)
+    directory = os.path.dirname(target)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    fh = open(target, 'w')
+    try:
+        fh.write(pruned)
+    finally:
+        fh.close()
+    return len(data), len(pruned)
@@ -0,0 +1,104 @@
+from collections import OrderedDict
+import bisect
+import csv
+import json
+
+# The fields of each record, one record being written per selector.
+fields = ('file', 'line', 'column', 'selector', 'count')
+
+def line_starts(path, chunk_size=65536):
+    """Returns the offset at which each line of the file at path starts."""
+    starts = [0]
+    offset = 0
+    fh = open(path, 'rb')
+    try:
+        while True:
+            chunk = fh.read(chunk_size)
+            if not chunk:
+                break
+            i = chunk.find('\n')
+            while i != -1:
+                starts.append(offset + i + 1)
+                i = chunk.find('\n', i + 1)
+            offset += len(chunk)
+    finally:
+        fh.close()
+    return starts
+
+def locate(starts, offset):
+    """Returns the line and column, both counted from 1, of an offset."""
+    line = bisect.bisect_right(starts, offset)
+    return line, offset - starts[line - 1] + 1
+
+class Report:
+    """
+    Writes the results of a run to fh as they come in, a stylesheet at a
+    time, so they can be read while a long run is still going.
+
+    Each selector gives a record of the fields above: the CSS file, the
+    line and column of its rule, the selector and the number of pages it
+    matched on.  Without counts, only unused selectors are written, as in
+    the default output.
+    """
+
+    def __init__(self, fh, counts=False):
+        self.fh = fh
+        self.counts = counts
+
+    def add(self, css_path, hits, offsets):
+        """
+        Writes the records of a CSS file, given its list of (selector,
+        count) pairs and the offsets of their rules.
+        """
+        starts = line_starts(css_path)
+        for (selector, count), offset in zip(hits, offsets):
+            if count and not self.counts:
+                continue
+            line, column = locate(starts, offset)
+            self.write(OrderedDict(zip(fields, (css_path, line, column,
+                                                selector, count))))
+        self.fh.flush()
+
+    def close(self):
+        self.fh.flush()
+
+class JSONLinesReport(Report):
+    """One JSON object per line."""
+
+    def write(self, record):
+        self.fh.write(json.dumps(record) + '\n')
+
+class JSONReport(Report):
+    """
+    A JSON array of objects.  It is written an object at a time, so it is
+    only complete once the report is closed.
+    """
+
+    def __init__(self, fh, counts=False):
+        Report.__init__(self, fh, counts)
+        self.fh.write('[')
+        self.separator = '\n'
+
+    def write(self, record):
+        self.fh.write(self.separator + json.dumps(record))
+        self.separator = ',\n'
+
+    def close(self):
+        self.fh.write('\n]\n')
+        Report.close(self)
+
+class CSVReport(Report):
+    """Comma separated values, with a header row."""
+
+    def __init__(self, fh, counts=False):
+        Report.__init__(self, fh, counts)
+        self.writer = csv.writer(fh)
+        self.writer.writerow(fields)
+
+    def write(self, record):
+        self.writer.writerow([value.encode('utf-8')
+                              if isinstance(value, unicode) else value
+                              for value in record.values()])
+
+reports = OrderedDict([('json', JSONReport), ('jsonl', JSONLinesReport),
+                       ('csv', CSVReport)])
@@ -0,0 +1,216 @@
+from parser import CSSParser
+from document import Document
+from matcher import Matcher
+from collections import OrderedDict
+from lxml.etree import ParserError
+import BaseHTTPServer
+import Queue
+import SocketServer
+import argparse
+import hashlib
+import json
+import logging
+import os
+import time
+
+class Session:
+    """
+    A warm parser, matcher and set of parsed documents, used by one request
+    at a time and kept between requests.  Nothing in a session is shared
+    with other threads, as neither ply parsers nor lxml trees are safe to
+    use from several threads at once.
+    """
+
+    def __init__(self, tabledir=None, fast=False, max_documents=32):
+        self.parser = CSSParser(False, tabledir, fast)
+        self.matcher = Matcher()
+        self.documents = OrderedDict()
+        self.max_documents = max_documents
+
+    def load(self, item, i):
+        """
+        Returns a (name, key, data) tuple for a CSS or HTML item of a
+        request, which is either {"path": ...} or {"text": ..., "name": ...}.
+        key identifies the content without reading it, where possible.
+        """
+        if 'path' in item:
+            path = item['path']
+            st = os.stat(path)
+            key = (path, st.st_mtime, st.st_size)
+            return path, key, lambda: open(path).read()
+        text = item['text']
+        if isinstance(text, unicode):
+            text = text.encode('utf-8')
+        name = item.get('name', '<{0}>'.format(i))
+        return name, hashlib.sha1(text).hexdigest(), lambda: text
+
+    def document(self, item, i):
+        """
+        Returns the Document of an HTML item, or None, with a warning, if
+        lxml can't parse it, as for an empty page.
+        """
+        name, key, read = self.load(item, i)
+        try:
+            document = self.documents.pop(key)
+        except KeyError:
+            try:
+                document = Document(read(), name)
+            except ParserError as e:
+                logging.warning('Skipping {0}: {1}'.format(name, e))
+                return None
+            if len(self.documents) >= self.max_documents:
+                self.documents.popitem(last=False)
+        self.documents[key] = document
+        return document
+
+    def check(self, request):
+        """
+        Checks the stylesheets of a request against its pages and returns
+        the response: the unused selectors of each stylesheet and the time
+        taken by each step, in milliseconds.
+        """
+        timing = OrderedDict()
+        start = last = time.time()
+
+        stylesheets = []
+        for i, item in enumerate(request.get('css', [])):
+            name, key, read = self.load(item, i)
+            self.parser.parse(read())
+            stylesheets.append((name, list(self.parser.selectors)))
+        now = time.time()
+        timing['parse_css'] = (now - last) * 1000
+        last = now
+
+        documents = [self.document(item, i)
+                     for i, item in enumerate(request.get('html', []))]
+        documents = [document for document in documents
+                     if document is not None]
+        now = time.time()
+        timing['parse_html'] = (now - last) * 1000
+        last = now
+
+        pending = set()
+        for name, selectors in stylesheets:
+            pending.update(selectors)
+        used = set()
+        for document in documents:
+            if not pending:
+                break
+            matched = self.matcher.matching(pending, document)
+            used.update(matched)
+            pending -= matched
+        now = time.time()
+        timing['match'] = (now - last) * 1000
+        timing['total'] = (now - start) * 1000
+
+        unused = OrderedDict()
+        for name, selectors in stylesheets:
+            unused[name] = [s for s in selectors if s not in used]
+        return {'unused': unused, 'timing': timing}
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    POST /unused with a JSON body of the form
+
+        {"css": [{"path": "a.css"}, {"name": "b.css", "text": "h1 {}"}],
+         "html": [{"path": "index.html"}]}
+
+    returns {"unused": {"a.css": [...], ...}, "timing": {...}}.
+    """
+
+    def do_POST(self):
+        if self.path != '/unused':
+            return self.send_json(404, {'error': 'not found'})
+
+        try:
+            length = int(self.headers.getheader('content-length', 0))
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise ValueError('expected a JSON object')
+        except ValueError as e:
+            return self.send_json(400, {'error': str(e)})
+
+        # Waiting for a free session is what limits concurrent requests.
+        try:
+            session = self.server.sessions.get(timeout=self.server.wait)
+        except Queue.Empty:
+            return self.send_json(503, {'error': 'too many requests'})
+        try:
+            response = session.check(request)
+        except (IOError, OSError, KeyError, TypeError) as e:
+            return self.send_json(400, {'error': str(e)})
+        except Exception as e:
+            logging.exception('Failed to check request')
+            return self.send_json(500, {'error': str(e)})
+        finally:
+            self.server.sessions.put(session)
+        self.send_json(200, response)
+
+    def send_json(self, status, data):
+        body = json.dumps(data)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.info(format % args)
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    A threaded HTTP server holding concurrency warm Sessions.  A request
+    waits up to wait seconds for a free session before being turned away.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, concurrency=4, wait=30, tabledir=None,
+                 fast=False):
+        BaseHTTPServer.HTTPServer.__init__(self, address, Handler)
+        self.wait = wait
+        self.sessions = Queue.Queue()
+        for i in range(concurrency):
+            self.sessions.put(Session(tabledir, fast))
+
+if __name__ == '__main__':
+
+    argparser = argparse.ArgumentParser(
+                    description='Serves css3tool checks over local HTTP.')
+    argparser.add_argument('--host',
+                           dest='host',
+                           default='127.0.0.1',
+                           help='address to listen on (default: 127.0.0.1)')
+    argparser.add_argument('--port',
+                           dest='port',
+                           type=int,
+                           default=8765,
+                           help='port to listen on (default: 8765)')
+    argparser.add_argument('--concurrency',
+                           dest='concurrency',
+                           type=int,
+                           default=4,
+                           metavar='N',
+                           help='number of requests handled at once '
+                                '(default: 4)')
+    argparser.add_argument('--table-dir',
+                           dest='tabledir',
+                           metavar='<dir>',
+                           help='directory in which to cache the generated '
+                                'parse tables between runs')
+    argparser.add_argument('--fast-lexer',
+                           dest='fast',
+                           action='store_true',
+                           help='tokenize CSS with the hand-written '
+                                'tokenizer instead of the ply lexer')
+    args = argparser.parse_args()
+
+    logging.basicConfig(level=logging.INFO,
+                        format='[%(levelname)s] %(message)s')
+
+    server = Server((args.host, args.port), args.concurrency,
+                    tabledir=args.tabledir, fast=args.fast)
+    logging.info('Listening on {0}:{1}'.format(args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
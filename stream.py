@@ -0,0 +1,94 @@
+import re
+
+# The characters that can change the nesting of a stylesheet, start or
+# end a statement, or start a comment or string.
+special = re.compile(r'[{};"\'/\\]')
+string_end = {'"': re.compile(r'[\\"\n]'), "'": re.compile(r"[\\'\n]")}
+
+def iter_statements(fh, chunk_size=65536):
+    """
+    Reads a stylesheet from the file object fh, chunk_size characters at
+    a time, and yields an (offset, text) pair for each top-level statement
+    as soon as its end has been read: a ruleset or at-rule block once its
+    braces are closed, or an at-rule such as @import at its semicolon.
+    offset is where text starts in the file.
+
+    Only the statement being read and the current chunk are held in
+    memory, so a large @media block is held in full but a large file of
+    small rules never is.
+    """
+    buf = ''
+    base = 0    # offset of buf[0] in the file
+    start = 0   # start of the current statement in buf
+    pos = 0     # where scanning resumes in buf
+    depth = 0
+    mode = None # None, 'comment' or the quote of the current string
+
+    while True:
+        chunk = fh.read(chunk_size)
+        if not chunk:
+            break
+        buf = buf[start:] + chunk
+        base += start
+        pos -= start
+        start = 0
+
+        while True:
+            if mode == 'comment':
+                i = buf.find('*/', pos)
+                if i < 0:
+                    # Keep a trailing '*' in case the '/' is in the next chunk.
+                    pos = max(pos, len(buf) - 1)
+                    break
+                pos = i + 2
+                mode = None
+                continue
+
+            if mode is not None:
+                m = string_end[mode].search(buf, pos)
+                if not m:
+                    pos = len(buf)
+                    break
+                i = m.start()
+                if m.group() == '\\':
+                    if i + 1 >= len(buf):
+                        pos = i
+                        break
+                    pos = i + 2
+                else:
+                    pos = i + 1
+                    mode = None
+                continue
+
+            m = special.search(buf, pos)
+            if not m:
+                pos = len(buf)
+                break
+            c = m.group()
+            i = m.start()
+            pos = i + 1
+
+            if c == '/' or c == '\\':
+                if i + 1 >= len(buf):
+                    pos = i
+                    break
+                if c == '\\':
+                    pos = i + 2
+                elif buf[i + 1] == '*':
+                    pos = i + 2
+                    mode = 'comment'
+            elif c == '"' or c == "'":
+                mode = c
+            elif c == '{':
+                depth += 1
+            elif c == '}' and depth > 0:
+                depth -= 1
+                if depth == 0:
+                    yield base + start, buf[start:pos]
+                    start = pos
+            elif c == ';' and depth == 0:
+                yield base + start, buf[start:pos]
+                start = pos
+
+    if buf[start:].strip():
+        yield base + start, buf[start:]
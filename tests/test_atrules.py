@@ -0,0 +1,57 @@
+import unittest
+
+from atrules import AtRuleUsage, families
+from parser import CSSParser
+
+parser = CSSParser()
+
+faces = ('@font-face { font-family: "Foo Bar"; src: url(a.woff) }\n'
+         '@font-face { font-family: Baz; src: url(b.woff) }\n'
+         '@keyframes spin { to { color: red } }\n'
+         '@-webkit-keyframes fade { to { color: red } }\n')
+
+class AtRuleUsageTest(unittest.TestCase):
+
+    def usage(self, data, used=('a',)):
+        data = faces + data
+        return AtRuleUsage([('a.css', data, parser.parse(data))], set(used))
+
+    def unused(self, data, used=('a',)):
+        usage = self.usage(data, used)
+        return ([face[0] for face in usage.unused_faces()],
+                [keyframes[0] for keyframes in usage.unused_keyframes()])
+
+    def test_unused(self):
+        self.assertEqual(self.unused('a { color: red }'),
+                         (['Foo Bar', 'Baz'], ['spin', 'fade']))
+
+    def test_used(self):
+        self.assertEqual(self.unused('a { font-family: "foo bar", serif; '
+                                     'animation: spin 1s; '
+                                     '-webkit-animation-name: fade }'),
+                         (['Baz'], []))
+
+    def test_font_shorthand(self):
+        self.assertEqual(self.unused('a { font: italic 12px/1.5 Foo Bar, '
+                                     'Baz }')[0], [])
+
+    def test_only_used_rules_count(self):
+        self.assertEqual(self.unused('b { font-family: Baz; '
+                                     'animation-name: spin }'),
+                         (['Foo Bar', 'Baz'], ['spin', 'fade']))
+        self.assertEqual(self.unused('b, a { font-family: Baz }')[0],
+                         ['Foo Bar'])
+
+    def test_inside_media(self):
+        self.assertEqual(self.unused('@media print { a { font-family: Baz; '
+                                     'animation-name: spin } }'),
+                         (['Foo Bar'], ['fade']))
+
+    def test_families(self):
+        self.assertEqual(families(['"Foo Bar"', ',', 'serif']),
+                         set(['foo bar', 'serif']))
+        self.assertEqual(families(['bold', 'Foo', 'Bar'], True),
+                         set(['bold foo bar', 'foo bar', 'bar']))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cache import ResultCache
+from css3tool import parse_css
+from parser import CSSParser
+
+parser = CSSParser()
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.directory, 'cache')
+        self.path = self.write('a.css', 'a {}\nb {}\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        fh = open(path, 'w')
+        fh.write(data)
+        fh.close()
+        return path
+
+    def test_stylesheet_cached(self):
+        cache = ResultCache(self.cache_dir)
+        self.assertEqual(parse_css(self.path, parser, cache=cache),
+                         (['a', 'b'], [0, 5]))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(parse_css(self.path, parser, cache=cache),
+                         (['a', 'b'], [0, 5]))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_content_change_invalidates(self):
+        cache = ResultCache(self.cache_dir)
+        key = cache.file_digest(self.path)
+        parse_css(self.path, parser, cache=cache)
+        self.write('a.css', 'i {}\n')
+        self.assertNotEqual(cache.file_digest(self.path), key)
+        self.assertEqual(parse_css(self.path, parser, cache=cache),
+                         (['i'], [0]))
+        self.assertEqual((cache.hits, cache.misses), (0, 2))
+
+    def test_salt_change_invalidates(self):
+        cache = ResultCache(self.cache_dir, salt='1')
+        cache.put_matches(cache.digest('<html/>'), {'a': True})
+        self.assertEqual(cache.get_matches(cache.digest('<html/>')),
+                         {'a': True})
+        other = ResultCache(self.cache_dir, salt='2')
+        self.assertNotEqual(other.digest('<html/>'), cache.digest('<html/>'))
+        self.assertNotEqual(other.file_digest(self.path),
+                            cache.file_digest(self.path))
+        self.assertEqual(other.get_matches(other.digest('<html/>')), {})
+        self.assertEqual(other.misses, 1)
+
+    def test_unreadable_entry_ignored(self):
+        cache = ResultCache(self.cache_dir)
+        key = cache.file_digest(self.path)
+        fh = open(os.path.join(self.cache_dir, 'stylesheets', key), 'w')
+        fh.write('not a pickle')
+        fh.close()
+        self.assertEqual(cache.get_stylesheet(key), None)
+        self.assertEqual(parse_css(self.path, parser, cache=cache),
+                         (['a', 'b'], [0, 5]))
+
+    def test_evict(self):
+        cache = ResultCache(self.cache_dir, max_size=0)
+        cache.put_matches('x', {'a': True})
+        cache.evict()
+        self.assertEqual(cache.get_matches('x'), {})
+
+if __name__ == '__main__':
+    unittest.main()
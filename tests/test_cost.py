@@ -0,0 +1,57 @@
+import unittest
+
+from cost import CostReport, selector_cost
+from document import Document
+from parser import CSSParser
+
+parser = CSSParser()
+
+page = Document('<html><body>'
+                + '<div class="x"><p><a>x</a></p></div>' * 10
+                + '<a id="y">y</a></body></html>', 'page.html')
+
+class CostTest(unittest.TestCase):
+
+    def costs(self, data, *pages):
+        costs = CostReport([('a.css', data, parser.parse(data))])
+        for document in pages or (page,):
+            costs.add(document)
+        return costs
+
+    def test_ordering(self):
+        costs = self.costs('#y {}\n.x p {}\n* {}\ndiv * {}\n'
+                           'div ~ * [title*="a"] {}\n.x {}\n')
+        self.assertEqual([score[1] for score in costs.worst(10)],
+                         ['div ~ * [title*="a"]', 'div *', '.x p', '*', '.x',
+                          '#y'])
+
+    def test_limit(self):
+        costs = self.costs('#y {}\n* {}\n.x {}\n')
+        self.assertEqual([score[1] for score in costs.worst(2)], ['*', '.x'])
+
+    def test_scores_added_over_pages(self):
+        once = self.costs('a {}\n').worst(1)[0]
+        twice = self.costs('a {}\n', page, page).worst(1)[0]
+        self.assertEqual(twice[0], 2 * once[0])
+        self.assertEqual(twice[5], 22)
+
+    def test_unused_bucket_costs_nothing(self):
+        costs = self.costs('a .z {}\n')
+        self.assertEqual(costs.worst(1)[0][0], 0)
+        self.assertEqual(costs.pages, set(['page.html']))
+
+    def test_descendant_costs_more_than_child(self):
+        child, descendant = [selector_cost(rule.selectors.selectors[0], 4, 2)
+                             for rule in parser.parse('a > b {} a b {}')
+                                               .statements]
+        self.assertTrue(descendant > child)
+
+    def test_reasons(self):
+        costs = self.costs('div ~ * a *[title*="a"]:not(.b) {}\n')
+        self.assertEqual(costs.worst(1)[0][6],
+                         ['universal rightmost compound',
+                          '3 descendant or sibling combinators',
+                          '1 substring attribute match(es)', '1 :not()'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+
+from duplicates import Analysis
+from parser import CSSParser
+
+parser = CSSParser()
+
+class AnalysisTest(unittest.TestCase):
+
+    def analyse(self, *sheets):
+        return Analysis([('{0}.css'.format(i), data, parser.parse(data))
+                         for i, data in enumerate(sheets)])
+
+    def overridden(self, *sheets):
+        analysis = self.analyse(*sheets)
+        return [entry.data[d.start:d.end] for entry, d in analysis.overridden]
+
+    def test_later_declaration_overrides(self):
+        self.assertEqual(self.overridden('.y { color: green }\n'
+                                         '.y { color: black }\n'),
+                         ['color: green'])
+
+    def test_important_declaration_overrides_later(self):
+        self.assertEqual(self.overridden('.y { color: green !important }\n'
+                                         '.y { color: black }\n'),
+                         ['color: black'])
+
+    def test_later_important_declaration_overrides(self):
+        self.assertEqual(self.overridden('.y { color: green !important }\n',
+                                         '.y { color: black !important }\n'),
+                         ['color: green !important'])
+
+    def test_vendor_pseudo_rule_overrides_nothing(self):
+        analysis = self.analyse('a { color: red }\n'
+                                'a, a::-moz-selection { color: blue }\n')
+        self.assertEqual(analysis.overridden, [])
+        self.assertEqual(analysis.merge(),
+                         'a { color: red }\n'
+                         'a, a::-moz-selection { color: blue }\n')
+
+    def test_vendor_pseudos_not_grouped(self):
+        analysis = self.analyse('::-moz-placeholder { color: gray }\n'
+                                '::-webkit-input-placeholder '
+                                '{ color: gray }\n')
+        self.assertEqual(analysis.merge(),
+                         '::-moz-placeholder { color: gray }\n'
+                         '::-webkit-input-placeholder { color: gray }\n')
+
+    def test_standard_pseudos_grouped(self):
+        analysis = self.analyse('a:hover { color: gray }\n'
+                                'p::before { color: gray }\n')
+        self.assertEqual(analysis.merge(),
+                         'a:hover, p::before { color: gray }\n')
+
+if __name__ == '__main__':
+    unittest.main()
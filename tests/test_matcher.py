@@ -0,0 +1,51 @@
+import logging
+import unittest
+
+from document import Document
+from matcher import Matcher, compile_selector, static_selector
+
+page = Document('<html><body><svg><rect/></svg>'
+                '<a class="b">x</a></body></html>')
+
+class MatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        logging.disable(logging.WARNING)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def test_static_selector(self):
+        self.assertEqual(static_selector('a:hover > :focus::before'), 'a > *')
+        self.assertEqual(static_selector('a:not(:hover)'), 'a:not(:hover)')
+
+    def test_matching(self):
+        self.assertEqual(Matcher().matching(['a.b', 'a b', 'a:hover', 'p'],
+                                            page),
+                         set(['a.b', 'a:hover']))
+
+    def test_namespaced_selector_taken_to_be_used(self):
+        matcher = Matcher()
+        self.assertTrue(matcher.matches('svg|rect', page))
+        self.assertEqual(matcher.matching(['svg|rect'], page),
+                         set(['svg|rect']))
+
+    def test_matched_selector_not_tested_again(self):
+        # Both elements have class 'b', so both are in the bucket of
+        # '.b'; only the first is tested once it has matched.
+        tested = []
+        compiled = compile_selector('.b')
+        match = compiled.match
+        def counting(el, root, i=0):
+            tested.append(el)
+            return match(el, root, i)
+        compiled.match = counting
+        matcher = Matcher()
+        matcher.compiled['.b'] = compiled
+        document = Document('<html><body><p class="b"></p>'
+                            '<p class="b"></p></body></html>')
+        self.assertEqual(matcher.matching(['.b'], document), set(['.b']))
+        self.assertEqual(len(tested), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import logging
+import unittest
+
+from lexer import CSSLexer
+from minify import minify
+
+class Warnings(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class MinifyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lexer = CSSLexer()
+        self.warnings = Warnings()
+        logging.getLogger().addHandler(self.warnings)
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.warnings)
+
+    def check(self, data, expected):
+        self.assertEqual(minify(data, self.lexer), expected)
+        self.assertEqual(self.warnings.messages, [])
+
+    def test_whitespace(self):
+        self.check('a  >  b ,  c  d {\n  border : 1px  solid ;\n}\n',
+                   'a>b,c d{border:1px solid}')
+
+    def test_adjacent_tokens(self):
+        self.check('@font-face { unicode-range: U+0025-00FF; }',
+                   '@font-face{unicode-range:U+0025-00FF}')
+
+    def test_tokens_apart_by_comment(self):
+        self.check('a/**/b { margin: 1px/**/2px }', 'a b{margin:1px 2px}')
+        self.check('a/**/.b {}', 'a.b{}')
+
+    def test_slash(self):
+        self.check('a { font: 12px / 1.5 serif; grid-area: 1 / 2 }',
+                   'a{font:12px/1.5 serif;grid-area:1/2}')
+        self.check('a{font:12px/1.5 serif}', 'a{font:12px/1.5 serif}')
+
+    def test_zero_lengths(self):
+        self.check('a { margin: 0px 0em; width: 0px; transition: 0s }',
+                   'a{margin:0 0;width:0;transition:0s}')
+
+    def test_zero_flex_basis_kept(self):
+        self.check('a { flex: 1 1 0px; -webkit-flex: 1 1 0% }',
+                   'a{flex:1 1 0px;-webkit-flex:1 1 0%}')
+
+    def test_colors(self):
+        self.check('a { color: #FF0000; background: white; '
+                   'animation-name: red }',
+                   'a{color:red;background:#fff;animation-name:red}')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+from StringIO import StringIO
+import unittest
+
+from parser import CSSParser
+
+parser = CSSParser()
+
+class StreamTest(unittest.TestCase):
+
+    def check(self, data):
+        """Parses data whole and a statement at a time, for comparing."""
+        parser.parse(data)
+        whole = (parser.selectors[:], parser.offsets[:], parser.skipped[:])
+        list(parser.iterparse(StringIO(data), chunk_size=1))
+        streamed = (parser.selectors, parser.offsets, parser.skipped)
+        self.assertEqual(streamed, whole)
+        return whole
+
+    def test_garbage_after_rule(self):
+        selectors, offsets, skipped = self.check('a { b: c } } d {}')
+        self.assertEqual(selectors, ['a', 'd'])
+        self.assertEqual(skipped, [(11, 12)])
+
+    def test_garbage_at_start(self):
+        selectors, offsets, skipped = self.check('} } d {} ;')
+        self.assertEqual(selectors, ['d'])
+        self.assertEqual(skipped, [(0, 1), (2, 3), (9, 10)])
+
+    def test_bad_rule_at_start(self):
+        selectors, offsets, skipped = self.check('] a { b: c } d {}')
+        self.assertEqual(selectors, ['d'])
+        self.assertEqual(skipped, [(0, 12)])
+
+    def test_garbage_at_end(self):
+        for data, skipped in [('a {} ]', [(5, 6)]), ('a {} )', [(5, 6)]),
+                              ('a {} {{{{', [(5, 9)]),
+                              ('a {} ] c {} ]', [(5, 11), (12, 13)])]:
+            self.assertEqual(self.check(data), (['a'], [0], skipped))
+            stylesheet = parser.parse(data)
+            self.assertEqual([rule.selectors.selectors[0].text
+                              for rule in stylesheet.statements], ['a'])
+
+    def test_stylesheet_always_returned(self):
+        for data in ['', ' ', ']', '{{', 'a {} ]']:
+            self.assertTrue(parser.parse(data) is not None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from lexer import CSSLexer
+from parser import CSSParser
+from prune import common_dir, prune, prune_file, prune_statements
+
+parser = CSSParser()
+
+class PruneTest(unittest.TestCase):
+
+    def prune(self, data, *unused):
+        return prune(data, parser.parse(data), set(unused))
+
+    def test_cuts(self):
+        data = 'a { color: red }\nb { color: red }\n'
+        cuts = []
+        self.assertFalse(prune_statements(data, parser.parse(data).statements,
+                                          set(['b']), cuts))
+        self.assertEqual(cuts, [(17, 34, '')])
+        cuts = []
+        self.assertTrue(prune_statements(data, parser.parse(data).statements,
+                                         set(['a', 'b']), cuts))
+        self.assertEqual(cuts, [(0, 17, ''), (17, 34, '')])
+
+    def test_unused_rule(self):
+        self.assertEqual(self.prune('a { color: red }\n'
+                                    '  b { color: red }  \n'
+                                    'i { color: red }\n', 'b'),
+                         'a { color: red }\ni { color: red }\n')
+
+    def test_unused_selector_of_group(self):
+        self.assertEqual(self.prune('a, b,\ni { color: red }\n', 'b'),
+                         'a,\ni { color: red }\n')
+        self.assertEqual(self.prune('a, b,\ni { color: red }\n', 'a'),
+                         'b,\ni { color: red }\n')
+
+    def test_empty_block(self):
+        self.assertEqual(self.prune('@media print {\n  a {}\n  b {}\n}\n'
+                                    'i {}\n', 'a', 'b'),
+                         'i {}\n')
+        self.assertEqual(self.prune('@media print { a {} b {} }', 'a'),
+                         '@media print { b {} }')
+
+    def test_other_statements_kept(self):
+        data = '@import "x.css";\n/* a */\na {}\n@font-face { src: url(x) }\n'
+        self.assertEqual(self.prune(data, 'a'),
+                         '@import "x.css";\n/* a */\n'
+                         '@font-face { src: url(x) }\n')
+
+    def test_common_dir(self):
+        self.assertEqual(common_dir(['/a/b/c.css', '/a/b/d/e.css']), '/a/b')
+        self.assertEqual(common_dir(['/a/c.css', '/b/c.css']), '/')
+
+    def test_prune_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            target = os.path.join(directory, 'sub', 'a.css')
+            data = 'a { color: #ff0000 }\nb { color: red }\n'
+            sizes = prune_file(data, parser.parse(data), target, set(['b']),
+                               CSSLexer())
+            self.assertEqual(open(target).read(), 'a{color:red}')
+            self.assertEqual(sizes, (len(data), len('a{color:red}')))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
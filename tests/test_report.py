@@ -0,0 +1,82 @@
+import csv
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from css3tool import parse_css
+from parser import CSSParser
+from report import CSVReport, JSONLinesReport, JSONReport
+
+parser = CSSParser()
+
+css = ('a { color: red }\n'
+       '\n'
+       '  b,\n'
+       'i { color: red } @media print {\n'
+       '    p { color: red }\n'
+       '}\n')
+
+# The (line, column) of the rule of each selector, in the order the parser
+# gives them.
+locations = [('a', 1, 1), ('i', 3, 3), ('b', 3, 3), ('p', 5, 5)]
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'a.css')
+        fh = open(self.path, 'w')
+        fh.write(css)
+        fh.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def records(self, stream, counts=True):
+        selectors, offsets = parse_css(self.path, parser, stream)
+        out = StringIO()
+        report = JSONLinesReport(out, counts)
+        report.add(self.path, [(selector, i % 2)
+                               for i, selector in enumerate(selectors)],
+                   offsets)
+        report.close()
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_locations(self):
+        records = self.records(stream=False)
+        self.assertEqual([(r['selector'], r['line'], r['column'])
+                          for r in records], locations)
+        self.assertEqual(set(r['file'] for r in records), set([self.path]))
+
+    def test_streamed_locations(self):
+        self.assertEqual(self.records(stream=True),
+                         self.records(stream=False))
+
+    def test_only_unused_without_counts(self):
+        self.assertEqual([r['selector'] for r in
+                          self.records(stream=False, counts=False)],
+                         ['a', 'b'])
+
+    def test_formats(self):
+        selectors, offsets = parse_css(self.path, parser)
+        pairs = [(selector, 0) for selector in selectors]
+        out = StringIO()
+        report = JSONReport(out)
+        report.add(self.path, pairs, offsets)
+        report.close()
+        self.assertEqual([r['selector'] for r in json.loads(out.getvalue())],
+                         selectors)
+        out = StringIO()
+        report = CSVReport(out)
+        report.add(self.path, pairs, offsets)
+        report.close()
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0], ['file', 'line', 'column', 'selector',
+                                   'count'])
+        self.assertEqual(rows[2], [self.path, '3', '3', 'i', '0'])
+
+if __name__ == '__main__':
+    unittest.main()
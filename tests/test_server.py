@@ -0,0 +1,69 @@
+import json
+import logging
+import threading
+import unittest
+import urllib2
+
+from server import Server
+
+class ServerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = Server(('127.0.0.1', 0), concurrency=1, wait=0)
+        cls.url = 'http://127.0.0.1:{0}'.format(cls.server.server_address[1])
+        thread = threading.Thread(target=cls.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        logging.disable(logging.ERROR)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+
+    def post(self, body, path='/unused'):
+        """Returns the status and the JSON response of a request."""
+        try:
+            response = urllib2.urlopen(self.url + path, body)
+        except urllib2.HTTPError as e:
+            response = e
+        return response.getcode(), json.loads(response.read())
+
+    def test_unused(self):
+        status, response = self.post(json.dumps({
+            'css': [{'name': 'a.css', 'text': 'a {} b {}'}],
+            'html': [{'text': '<html><body><a>x</a></body></html>'},
+                     {'text': ''}]}))
+        self.assertEqual(status, 200)
+        self.assertEqual(response['unused'], {'a.css': ['b']})
+        self.assertEqual(set(response['timing']),
+                         set(['parse_css', 'parse_html', 'match', 'total']))
+
+    def test_not_found(self):
+        status, response = self.post('{}', '/used')
+        self.assertEqual(status, 404)
+
+    def test_bad_request(self):
+        for body in ('{', '[]', '{"css": [{"path": "/no/such/file.css"}]}',
+                     '{"css": [{"name": "a.css"}]}'):
+            status, response = self.post(body)
+            self.assertEqual(status, 400, body)
+            self.assertTrue(response['error'])
+
+    def test_busy(self):
+        session = self.server.sessions.get()
+        try:
+            status, response = self.post('{}')
+        finally:
+            self.server.sessions.put(session)
+        self.assertEqual(status, 503)
+        self.assertEqual(self.post('{}')[0], 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import glob
+import os
+import unittest
+
+from benchmark import tokens
+from lexer import CSSLexer
+from tokenizer import Tokenizer
+
+example = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                       'example')
+
+# Inputs where the two are most likely to part ways.
+edge_inputs = [
+    '/* a comment */ a /* another\n one */ { }',
+    '/* unterminated comment\n a { }',
+    'a/**/b{}',
+    '.\\31 0, #a\\:b, .\\"q { content: "\\"" }',
+    'a { content: "unterminated\n}',
+    "a { content: 'unterminated",
+    'a { content: "multi\\\nline" }',
+    '@font-face { unicode-range: U+0025-00FF, u+4??, U+10FFFF }',
+    'a { color: red !important; b: c ! important; d: e !IMPORTANT }',
+    'a { font: 12px/1.5 serif; width: calc(100%/3 - 1.5em) }',
+    'url(a.png) url( "b.png" ) url(c',
+    '<!-- a { } --> @media only screen and (max-width: 600px) { }',
+    'a:not(.b) a:nth-child(-2n+1) [a~="b"] [a|=b] [a^=b] [a$=b] [a*=b]',
+    '$ & ? ` @ #',
+    '\n\n\r\n\t a\n{\n}\n',
+    '',
+]
+
+class TokenizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ply_lexer = CSSLexer()
+        self.fast_lexer = CSSLexer()
+        self.fast_lexer.lexer = Tokenizer()
+
+    def check(self, name, data):
+        expected, expected_output = tokens(self.ply_lexer, data)
+        found, output = tokens(self.fast_lexer, data)
+        # (type, value, lexpos, lineno) of each token, one at a time so a
+        # difference names the token.
+        for i, (a, b) in enumerate(map(None, expected, found)):
+            self.assertEqual(b, a, '{0}: token {1} is {2}, expected '
+                                   '{3}'.format(name, i, b, a))
+        self.assertEqual(output, expected_output, name)
+
+    def test_examples(self):
+        paths = glob.glob(os.path.join(example, '*.css')) + \
+                glob.glob(os.path.join(example, 'css', '*.css')) + \
+                glob.glob(os.path.join(example, 'css', '*', '*.css'))
+        self.assertTrue(paths)
+        for path in paths:
+            with open(path) as fh:
+                self.check(path, fh.read())
+
+    def test_edge_inputs(self):
+        for data in edge_inputs:
+            self.check(repr(data), data)
+
+if __name__ == '__main__':
+    unittest.main()
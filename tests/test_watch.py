@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from matcher import Matcher
+from parser import CSSParser
+from watch import Watcher
+
+parser = CSSParser()
+
+class WatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.css_paths = [self.write('a.css', 'a { color: red }\n'
+                                              'b { color: red }\n')]
+        self.html_paths = [self.write('a.html', '<html><body><a>x</a>'
+                                                '</body></html>')]
+        self.watcher = Watcher(lambda: self.css_paths,
+                               lambda: self.html_paths,
+                               parser, Matcher().matching)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, data):
+        path = os.path.join(self.directory, name)
+        fh = open(path, 'w')
+        fh.write(data)
+        fh.close()
+        return path
+
+    def test_poll(self):
+        unused, used = self.watcher.poll()
+        self.assertEqual(unused, {self.css_paths[0]: ['b']})
+        self.assertEqual(used, {})
+
+    def test_unreadable_files_skipped(self):
+        self.css_paths.append(os.path.join(self.directory, 'gone.css'))
+        self.html_paths.append(os.path.join(self.directory, 'gone.html'))
+        unused, used = self.watcher.poll()
+        self.assertEqual(unused, {self.css_paths[0]: ['b']})
+        self.assertEqual(sorted(self.watcher.stylesheets),
+                         [self.css_paths[0]])
+        self.assertEqual(sorted(self.watcher.pages), [self.html_paths[0]])
+
+    def test_empty_page_skipped(self):
+        self.html_paths.append(self.write('empty.html', ''))
+        unused, used = self.watcher.poll()
+        self.assertEqual(unused, {self.css_paths[0]: ['b']})
+
+    def test_file_watched_once_readable(self):
+        self.css_paths.append(os.path.join(self.directory, 'late.css'))
+        self.watcher.poll()
+        self.write('late.css', 'i { color: red }\n')
+        unused, used = self.watcher.poll()
+        self.assertEqual(unused, {self.css_paths[1]: ['i']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+class Untimed:
+    """Stands in for a phase of a run that isn't being timed."""
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+untimed = Untimed()
+
+class Profile:
+    """
+    The wall time spent in each phase of a run (reading files, building
+    the parser, lexing, parsing, parsing HTML, matching) and the number of
+    times it was entered, in total and for each file, along with the time
+    spent checking each selector, whether by walking the document or
+    evaluating it as XPath (see Matcher.matching).
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.phases = OrderedDict()     # phase -> [seconds, count]
+        self.files = OrderedDict()      # path -> phase -> [seconds, count]
+        self.selectors = {}             # selector -> [seconds, count]
+
+    def add(self, name, seconds, path=None, count=1):
+        totals = self.phases.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += count
+        if path is not None:
+            phases = self.files.setdefault(path, OrderedDict())
+            totals = phases.setdefault(name, [0.0, 0])
+            totals[0] += seconds
+            totals[1] += count
+
+    @contextmanager
+    def phase(self, name, path=None):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, time.time() - start, path)
+
+    @contextmanager
+    def parsing(self, parser, path=None):
+        """
+        Times parsing with a CSSParser.  The lexer is driven by the parser,
+        so the time spent fetching tokens is recorded as the lex phase,
+        with a count of the tokens read, and the rest as the parse phase.
+        """
+        spent = [0.0, 0]
+        token = parser.tokenfunc
+        def timed_token():
+            start = time.time()
+            tok = token()
+            spent[0] += time.time() - start
+            spent[1] += 1
+            return tok
+
+        parser.tokenfunc = timed_token
+        start = time.time()
+        try:
+            yield
+        finally:
+            parser.tokenfunc = token
+            self.add('lex', spent[0], path, spent[1])
+            self.add('parse', time.time() - start - spent[0], path)
+
+    def add_selector(self, selector, seconds):
+        totals = self.selectors.setdefault(selector, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def report(self, slowest=10):
+        """
+        Returns the profile as a dict that can be written as JSON, listing
+        the slowest selectors by their total time.
+        """
+        def phases(totals):
+            return OrderedDict((name, {'seconds': seconds, 'count': count})
+                               for name, (seconds, count) in totals.items())
+
+        selectors = sorted(self.selectors.items(),
+                           key=lambda item: -item[1][0])
+        return OrderedDict([
+            ('total', time.time() - self.start),
+            ('phases', phases(self.phases)),
+            ('files', OrderedDict((path, phases(totals))
+                                  for path, totals in self.files.items())),
+            ('slowest_selectors', [{'selector': s, 'seconds': seconds,
+                                    'count': count}
+                                   for s, (seconds, count)
+                                   in selectors[:slowest]]),
+        ])
@@ -0,0 +1,184 @@
+from lexer import CSSLexer
+from ply.lex import LexToken
+import logging
+import re
+
+def rule(name):
+    """Compiles the regex of the CSSLexer token rule t_<name>."""
+    return re.compile(getattr(CSSLexer, 't_' + name).__doc__, re.IGNORECASE)
+
+dimension = rule('DIMENSION')
+notfunc = rule('NOTFUNC')
+uri = rule('URI')
+ident = rule('IDENT')
+hash = rule('HASH')
+percentage = rule('PERCENTAGE')
+important = rule('IMPORTANT_SYM')
+number = rule('NUMBER')
+string = rule('STRING')
+cdo = rule('CDO')
+cdc = rule('CDC')
+only = rule('ONLY')
+and_ = rule('AND')
+not_ = rule('NOT')
+comment = re.compile(CSSLexer.t_ignore_COMMENT, re.IGNORECASE)
+at_keywords = [(rule(name), name) for name in ('IMPORT_SYM', 'NAMESPACE_SYM',
+               'PAGE_SYM', 'FONT_FACE_SYM', 'MEDIA_SYM', 'CHARSET_SYM',
+               'SUPPORTS_SYM', 'KEYFRAMES_SYM', 'ATKEYWORD')]
+
+# The two character attribute operators, by their first character.
+operators = {'~': 'INCLUDES', '|': 'DASHMATCH', '^': 'PREFIXMATCH',
+             '$': 'SUFFIXMATCH', '*': 'SUBSTRINGMATCH'}
+
+# The rules that can match at a character, in the order CSSLexer tries
+# them, for the characters that start a number and for the few letters
+# that start a keyword.  IDENT and FUNCTION are handled together, as a
+# FUNCTION is just an IDENT followed by '('.
+numeric = [(dimension, 'DIMENSION'), (percentage, 'PERCENTAGE'),
+           (number, 'NUMBER')]
+keywords = {'n': [(notfunc, 'NOTFUNC'), (None, 'FUNCTION'), (not_, 'NOT')],
+            'u': [(uri, 'URI'), (None, 'FUNCTION')],
+            'o': [(None, 'FUNCTION'), (only, 'ONLY')],
+            'a': [(None, 'FUNCTION'), (and_, 'AND')]}
+
+ignore = frozenset(CSSLexer.t_ignore)
+literals = frozenset(CSSLexer.literals)
+digits = frozenset('0123456789')
+name_start = frozenset('abcdefghijklmnopqrstuvwxyz'
+                       'ABCDEFGHIJKLMNOPQRSTUVWXYZ_\\')
+
+class Tokenizer:
+    """
+    A drop-in replacement for the ply lexer built by CSSLexer, giving the
+    same tokens for the same input, quirks included.
+
+    Rather than trying every token rule in turn through one large regex,
+    it looks at the first character of each token and only tries the
+    rules that can start with it, in the order CSSLexer would.  Plain
+    identifiers, the most common token, are matched by a single regex.
+    """
+
+    def __init__(self):
+        self.lexdata = ''
+        self.lexpos = 0
+        self.lexlen = 0
+        self.lineno = 1
+
+    def input(self, data):
+        self.lexdata = data
+        self.lexpos = 0
+        self.lexlen = len(data)
+
+    def make_token(self, type, value, pos):
+        tok = LexToken()
+        tok.type = type
+        tok.value = value
+        tok.lineno = self.lineno
+        tok.lexpos = pos
+        self.lexpos = pos + len(value)
+        return tok
+
+    def match(self, candidates, data, pos):
+        """
+        Returns the token of the first of candidates to match at pos, or
+        None.  A candidate of None stands for FUNCTION.
+        """
+        m = None
+        for regex, type in candidates:
+            if regex is None:
+                m = ident.match(data, pos)
+                if m and data[m.end():m.end() + 1] == '(':
+                    return self.make_token(type, data[pos:m.end() + 1], pos)
+                continue
+            m = regex.match(data, pos)
+            if m:
+                return self.make_token(type, m.group(), pos)
+        return None
+
+    def token(self):
+        data = self.lexdata
+        pos = self.lexpos
+        end = self.lexlen
+
+        while pos < end:
+            c = data[pos]
+            if c in ignore:
+                pos += 1
+                continue
+
+            if c in name_start or c >= '\x80':
+                tok = None
+                candidates = keywords.get(c.lower())
+                if candidates:
+                    tok = self.match(candidates, data, pos)
+                if tok is None:
+                    m = ident.match(data, pos)
+                    if m:
+                        stop = m.end()
+                        if data[stop:stop + 1] == '(':
+                            return self.make_token('FUNCTION',
+                                                   data[pos:stop + 1], pos)
+                        return self.make_token('IDENT', m.group(), pos)
+                else:
+                    return tok
+
+            elif c in digits or c == '.' or c == '+':
+                tok = self.match(numeric, data, pos)
+                if tok:
+                    return tok
+
+            elif c == '-':
+                tok = self.match([(dimension, 'DIMENSION'),
+                                  (None, 'FUNCTION'),
+                                  (percentage, 'PERCENTAGE'),
+                                  (cdc, 'CDC'),
+                                  (number, 'NUMBER'),
+                                  (ident, 'IDENT')], data, pos)
+                if tok:
+                    return tok
+
+            elif c in operators:
+                if data[pos + 1:pos + 2] == '=':
+                    return self.make_token(operators[c], c + '=', pos)
+
+            elif c == '#':
+                m = hash.match(data, pos)
+                if m:
+                    return self.make_token('HASH', m.group(), pos)
+
+            elif c == '"' or c == "'":
+                m = string.match(data, pos)
+                if m:
+                    return self.make_token('STRING', m.group(), pos)
+
+            elif c == '@':
+                for regex, type in at_keywords:
+                    m = regex.match(data, pos)
+                    if m:
+                        return self.make_token(type, m.group(), pos)
+
+            elif c == '!':
+                m = important.match(data, pos)
+                if m:
+                    return self.make_token('IMPORTANT_SYM', m.group(), pos)
+
+            elif c == '<':
+                m = cdo.match(data, pos)
+                if m:
+                    return self.make_token('CDO', m.group(), pos)
+
+            elif c == '/':
+                m = comment.match(data, pos)
+                if m:
+                    pos = m.end()
+                    continue
+
+            if c in literals:
+                return self.make_token(c, c, pos)
+
+            # Same as CSSLexer.t_error.
+            logging.warning("Illegal character '{0}'".format(c))
+            pos += 1
+
+        self.lexpos = pos
+        return None
@@ -0,0 +1,182 @@
+from document import Document
+from lxml.etree import ParserError
+import hashlib
+import logging
+import os
+import time
+
+class Watched:
+    """A file being watched, and what was last worked out from it."""
+
+    def __init__(self, path):
+        self.path = path
+        self.stat = None
+        self.digest = None
+        self.value = None
+
+    def changed(self):
+        """
+        Returns the new content of the file if it has changed since the
+        last call, or None.  The content is only read if the file's mtime
+        or size has changed.
+        """
+        st = os.stat(self.path)
+        stat = (st.st_mtime, st.st_size)
+        if stat == self.stat:
+            return None
+
+        fh = open(self.path)
+        data = fh.read()
+        fh.close()
+        self.stat = stat
+        digest = hashlib.sha1(data).hexdigest()
+        if digest == self.digest:
+            return None
+        self.digest = digest
+        return data
+
+class Watcher:
+    """
+    Keeps the parsed stylesheets and pages of a run in memory and, each
+    time it is polled, re-checks only the stylesheets and pages that have
+    changed since.
+
+    find_css and find_html return the current lists of CSS and HTML paths,
+    so files added to a watched directory are picked up.
+    matching(selectors, document) returns the set of selectors that match
+    a page; its compiled selectors stay in memory between polls.
+    """
+
+    def __init__(self, find_css, find_html, parser, matching):
+        self.find_css = find_css
+        self.find_html = find_html
+        self.parser = parser
+        self.matching = matching
+        self.stylesheets = {}   # path -> Watched, value being its selectors
+        self.pages = {}         # path -> Watched, value being a Document
+                                # or None if the page can't be parsed
+        self.matched = {}       # page path -> set of selectors it matches
+        self.unused = {}        # CSS path -> set of unused selectors
+        self.selectors = set()  # every selector checked so far
+        self.unreadable = set()  # paths that couldn't be read last time
+
+    def update(self, watched, paths, parse):
+        """
+        Brings the watched files up to date with paths, parsing the new
+        and changed ones with parse.  Returns the set of changed paths.
+        A new file is only watched once it has been read.
+        """
+        changed = set()
+        for path in set(watched) - set(paths):
+            del watched[path]
+            changed.add(path)
+        for path in paths:
+            current = watched.get(path) or Watched(path)
+            try:
+                data = current.changed()
+            except (IOError, OSError) as e:
+                # Removed or unreadable since it was found; it is tried
+                # again next time.
+                if path not in self.unreadable:
+                    logging.warning("Can't read {0}: {1}".format(path, e))
+                    self.unreadable.add(path)
+                continue
+            self.unreadable.discard(path)
+            if data is not None:
+                current.value = parse(data, path)
+                watched[path] = current
+                changed.add(path)
+        return changed
+
+    def parse_css(self, data, path):
+        self.parser.parse(data)
+        return list(self.parser.selectors)
+
+    def parse_html(self, data, path):
+        try:
+            return Document(data, path)
+        except ParserError as e:
+            logging.warning('Skipping {0}: {1}'.format(path, e))
+            return None
+
+    def poll(self):
+        """
+        Re-checks whatever has changed and returns two dicts mapping CSS
+        paths to the selectors that have become unused and those that have
+        become used since the last poll.
+        """
+        css_changed = self.update(self.stylesheets, self.find_css(),
+                                  self.parse_css)
+        html_changed = self.update(self.pages, self.find_html(),
+                                   self.parse_html)
+        if not css_changed and not html_changed:
+            return {}, {}
+
+        selectors = set()
+        for watched in self.stylesheets.values():
+            selectors.update(watched.value)
+
+        # Unchanged pages have already been checked against every selector
+        # but the new ones; changed and new pages are checked against all.
+        new = selectors - self.selectors
+        for path in self.matched.keys():
+            if path not in self.pages:
+                del self.matched[path]
+        for path, watched in self.pages.items():
+            if path in html_changed or path not in self.matched:
+                todo = selectors
+                self.matched[path] = set()
+            else:
+                todo = new
+            if watched.value is not None:
+                self.matched[path].update(self.matching(todo,
+                                                        watched.value))
+        self.selectors = selectors
+
+        used = set()
+        for matched in self.matched.values():
+            used.update(matched)
+
+        newly_unused = {}
+        newly_used = {}
+        unused = {}
+        for path, watched in self.stylesheets.items():
+            unused[path] = set(watched.value) - used
+            before = self.unused.get(path, set())
+            if unused[path] - before:
+                newly_unused[path] = sorted(unused[path] - before)
+            if path in self.unused and before - unused[path]:
+                newly_used[path] = sorted(before - unused[path])
+        self.unused = unused
+        return newly_unused, newly_used
+
+    def run(self, interval=0.5):
+        """
+        Prints the unused selectors, then polls every interval seconds and
+        prints the selectors that become unused or used, until interrupted.
+        """
+        self.poll()
+        report = {}
+        for path, watched in self.stylesheets.items():
+            report[path] = [s for s in watched.value if s in self.unused[path]]
+        print 'Unused Selectors:'
+        print report
+
+        try:
+            while True:
+                time.sleep(interval)
+                start = time.time()
+                newly_unused, newly_used = self.poll()
+                if not newly_unused and not newly_used:
+                    continue
+                elapsed = (time.time() - start) * 1000
+                print '[{0}] changes checked in {1:.0f} ms'.format(
+                      time.strftime('%H:%M:%S'), elapsed)
+                for path in sorted(set(newly_unused) | set(newly_used)):
+                    print path
+                    for s in newly_unused.get(path, []):
+                        print '  - {0}  (newly unused)'.format(s)
+                    for s in newly_used.get(path, []):
+                        print '  + {0}  (newly used)'.format(s)
+        except KeyboardInterrupt:
+            pass